@@ -10,7 +10,7 @@
 # Basic Discovery and Connection
 # ==============================
 
-# Auto-discover Pixelblaze (checks 192.168.4.1 first, then network scan)
+# Auto-discover Pixelblaze (last used IP, then 192.168.4.1, then listens for beacons)
 pb pixels
 
 # Use specific IP address
@@ -25,5 +25,33 @@
  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
  THE SOFTWARE.
  """
-from .pixelblaze import *
- 
+
+import sys
+import importlib
+
+# The client's main classes, which import it on first use
+_CLIENT_CLASSES = ('Pixelblaze', 'PBB', 'PBP', 'EPE', 'PixelblazeEnumerator')
+
+
+def _client():
+    return importlib.import_module('.pixelblaze', __name__)
+
+
+def __getattr__(name):
+    # Importing the client pulls in websocket-client, requests and mini-racer, so defer it until something from it
+    # is actually used; the `pb` CLI can then show help, manage its cache or hand off to its daemon without it.
+    # Only the main classes trigger the import, so probing for submodules (cli_utils, cli_daemon...) stays cheap.
+    if name == '__all__':
+        # `from pixelblaze import *` has always exported everything public in the client (its classes, and the
+        # modules it imports like time, math and json), as the package used to star-import it
+        return [n for n in dir(_client()) if not n.startswith('_')] + ['pixelblaze']
+    client = sys.modules.get(f'{__name__}.pixelblaze')
+    if client is None and name in _CLIENT_CLASSES:
+        client = _client()
+    if client is None or name.startswith('_') or not hasattr(client, name):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(client, name)
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_CLIENT_CLASSES))
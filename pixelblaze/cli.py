@@ -7,19 +7,30 @@ This module provides a modern CLI tool for controlling Pixelblazes with
 flexible discovery, pattern rendering, and configuration management.
 """
 
-import json as jsonlib
+from __future__ import annotations
+
+import sys
 import time
 import re
 import click
+import functools
 import pathlib
-from pixelblaze.pixelblaze import Pixelblaze, PBB
-from pixelblaze.cli_utils import cli, log, no_save_option, input_arg, read_input, parse_json, jsons, get_cache_dir, check, parse_vars
+from typing import TYPE_CHECKING
+from pixelblaze.cli_utils import cli, log, no_save_option, input_arg, read_input, is_file_path, parse_json, jsons, get_cache_dir, check, vars_callback, json_callback, get_cached_ip, IP_CACHE_FILE, LEGACY_IP_CACHE_FILE, BEACON_TIMEOUT_MS, json_dumps, json_loads, json_load_file, get_pattern_list, forget_pattern_list, get_pattern_cache_files, read_pattern_cache, PATTERN_CACHE_PREFIX
+
+if TYPE_CHECKING:
+    from pixelblaze.pixelblaze import Pixelblaze
+
 
 @click.group()
 @click.option(
     '--ip',
     default='auto',
-    help='IP address of Pixelblaze (default: auto discover mode, checks 192.168.4.1 first for Ad Hoc, then network scan)',
+    envvar='PB_IP',
+    help='IP address of Pixelblaze (default: auto discover mode, tries the last used IP, then 192.168.4.1 for Ad Hoc, then listens for Pixelblaze beacons). '
+         'Several comma-separated IPs, or "all" for every Pixelblaze on the network, runs the command on each at once, '
+         'labelling each line of output with the IP it came from. '
+         'Can also be set with the PB_IP environment variable',
     show_default=True
 )
 @click.option(
@@ -29,8 +40,13 @@ from pixelblaze.cli_utils import cli, log, no_save_option, input_arg, read_input
     help='Command timeout in seconds (default: 5.0)',
     show_default=True
 )
+@click.option(
+    '--no-cache',
+    is_flag=True,
+    help='Ignore the last used IP when auto discovering (e.g. after moving the Pixelblaze to another network)'
+)
 @click.pass_context
-def pixelblaze(ctx, ip, timeout):
+def pixelblaze(ctx, ip, timeout, no_cache):
     """
     Pixelblaze LED Controller CLI
 
@@ -39,6 +55,7 @@ def pixelblaze(ctx, ip, timeout):
     ctx.ensure_object(dict)
     ctx.obj['ip'] = ip
     ctx.obj['timeout'] = timeout
+    ctx.obj['no_cache'] = no_cache
 
 
 @cli(pixelblaze)
@@ -64,7 +81,7 @@ def pixels(pb: Pixelblaze, count, no_save):
 
 
 @cli(pixelblaze)
-@click.argument('brightness', type=float, default=1.0, required=False)
+@click.argument('brightness', type=click.FloatRange(0.0, 1.0), default=1.0, required=False)
 @click.option(
     '--play-sequencer',
     is_flag=True,
@@ -85,8 +102,6 @@ def on(pb: Pixelblaze, brightness, play_sequencer, no_save):
         pb on --play-sequencer      # Set brightness to 1.0 and start sequencer (saved)
         pb on 0.8 --no-save         # Set brightness to 80% (temporary only)
     """
-    check(0.0 <= brightness <= 1.0, "Brightness must be between 0.0 and 1.0")
-
     log(f"Setting brightness to {brightness}...")
     pb.setBrightnessSlider(brightness, saveToFlash=not no_save)
 
@@ -129,10 +144,10 @@ def off(pb: Pixelblaze, pause_sequencer, no_save):
     log(f"Pixelblaze {action}")
 
 
-@cli(pixelblaze)
+@cli(pixelblaze, name='map')
 @input_arg
 @click.option('--csv', is_flag=True, help='Output as csv instead of Pixelblaze 3-arrays')
-def map(pb: Pixelblaze, input, csv):
+def pixel_map(pb: Pixelblaze, input, csv):
     """
     Get or set the pixel map function.
 
@@ -145,6 +160,8 @@ def map(pb: Pixelblaze, input, csv):
         pb map                       # Get current map coordinates (normalized 0-1)
         pb map map.js                # Set map from file
         pb map < map.js              # Set map from stdin
+        pb map '[[0,0],[1,0],[0,1]]' # Set map coordinates
+        pb map --csv > map.csv; pb map map.csv   # Round-trip coordinates as CSV
     """
     content = read_input(input, "map", required=False)
     setting = content is not None
@@ -154,20 +171,61 @@ def map(pb: Pixelblaze, input, csv):
             log(f"Setting map function...")
             pb.setMapFunction(content)
         else:
-            # Also supporting numbers as strings
             log(f"Setting map coordinates...")
-            pb.setMapCoordinates(parse_json(jsonlib.dumps(parse_json(content)).replace('"', "")))
+            pb.setMapCoordinates(_parse_coordinates(content))
     elif csv:
         log(f"Fetching map coordinates as CSV...")
         coords = pb.getMapCoordinates()
-        click.echo("index,x,y,z")
-        for i in range(0, len(coords[0])):
-            click.echo(f"{i},{coords[0][i]},{coords[1][i]},{coords[2][i]}")
+        # Maps can be 1D, 2D or 3D; build the whole CSV and write it once
+        rows = [",".join(["index", *"xyz"[:len(coords)]])]
+        rows += [f"{i}," + ",".join(str(c) for c in point) for i, point in enumerate(zip(*coords))]
+        click.echo("\n".join(rows))
     else:
         log(f"Fetching map config...")
         jsons({'coordinates': pb.getMapCoordinates(), 'fn': pb.getMapFunction()})
 
 
+def _parse_coordinates(content):
+    """Parse map coordinates from a JSON/JSON5 array of points, or CSV rows like `map --csv` prints."""
+    if not content.lstrip().startswith('['):
+        rows = [line.split(',') for line in content.splitlines() if line.strip()]
+        # Drop a header row, and the index column if it's the `map --csv` layout
+        if rows and rows[0][0].strip().lower() == 'index':
+            rows = [row[1:] for row in rows[1:]]
+        elif rows and not _is_number(rows[0][0]):
+            rows = rows[1:]
+        check(rows, "No map coordinates provided")
+        return [[_to_number(value) for value in row] for row in rows]
+
+    try:
+        coords = json_loads(content)
+    except ValueError:
+        coords = parse_json(content)  # Unquoted keys, trailing commas, etc.
+    return _to_number(coords)
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _to_number(value):
+    """Coerce coordinates (possibly numeric strings, possibly nested in lists) to ints or floats."""
+    if isinstance(value, list):
+        return [_to_number(item) for item in value]
+    if isinstance(value, (int, float)):
+        return value
+    check(_is_number(value), f"Invalid map coordinate: {value!r}")
+    value = value.strip()
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
 @pixelblaze.group()
 def seq():
     """
@@ -213,9 +271,9 @@ def play(pb: Pixelblaze, no_save):
     log(f"Sequencer {action}")
 
 
-@cli(seq)
+@cli(seq, name='next')
 @no_save_option
-def next(pb: Pixelblaze, no_save):
+def next_pattern(pb: Pixelblaze, no_save):
     """
     Advance to the next pattern in the sequence.
 
@@ -246,11 +304,11 @@ def rand(pb: Pixelblaze):
     import random as rand
 
     log("Getting pattern list...")
-    patterns = pb.getPatternList()
+    patterns, _ = get_pattern_list(pb)
 
     check(patterns, "No patterns found on Pixelblaze")
 
-    pattern_id = rand.choice(list(patterns.keys()))
+    pattern_id = rand.choice(tuple(patterns))
     pattern_name = patterns[pattern_id]
 
     log(f"Selecting random pattern: {pattern_name}")
@@ -259,7 +317,7 @@ def rand(pb: Pixelblaze):
 
 
 @cli(seq, name='len')
-@click.argument('seconds', type=float)
+@click.argument('seconds', type=click.FloatRange(min=0, min_open=True))
 @no_save_option
 def set_duration(pb: Pixelblaze, seconds, no_save):
     """
@@ -274,22 +332,24 @@ def set_duration(pb: Pixelblaze, seconds, no_save):
         pb seq len 10          # Set all durations to 10 seconds (saved)
         pb seq len 30 --no-save   # Set to 30 seconds (temporary only)
     """
-    check(seconds > 0, "Duration must be greater than 0")
-
     milliseconds = int(seconds * 1000)
 
     log("Getting current playlist...")
     playlist = pb.getSequencerPlaylist()
 
-    items = playlist.get['playlist']['items']
+    items = playlist.get('playlist', {}).get('items')
     check(items, "Playlist is empty")
 
+    # The firmware has no per-field update, so resend just the id and item list (as the web UI does), not the
+    # position/timing state that came back with it
     original_count = len(items)
-    for item in items:
-        item['ms'] = milliseconds
+    items = [{'id': item['id'], 'ms': milliseconds} for item in items]
 
     log(f"Setting {original_count} pattern(s) to {seconds} seconds each...")
-    pb.setSequencerPlaylist(playlist)
+    pb.setSequencerPlaylist({
+        'playlist': {'id': playlist['playlist'].get('id', '_defaultplaylist_'), 'items': items},
+        'save': not no_save
+    })
 
     if not no_save:
         log("Saving playlist to flash...")
@@ -320,8 +380,9 @@ def set_duration(pb: Pixelblaze, seconds, no_save):
 )
 @click.option(
     '--var',
-    'var_args',
+    'variables',
     multiple=True,
+    callback=vars_callback,
     help='Variables/controls in flexible format: key value, key:value, or \'{json5}\''
 )
 @no_save_option
@@ -330,7 +391,7 @@ def set_duration(pb: Pixelblaze, seconds, no_save):
     is_flag=True,
     help='Require exact match for pattern name lookup'
 )
-def pattern(pb: Pixelblaze, input, write_target, rm, img, var_args, no_save, exact):
+def pattern(pb: Pixelblaze, input, write_target, rm, img, variables, no_save, exact):
     """
     Unified pattern command: switch to, render, or save patterns.
 
@@ -383,9 +444,6 @@ def pattern(pb: Pixelblaze, input, write_target, rm, img, var_args, no_save, exa
     # Check for conflicting flags
     check(not (write_target is not None and rm), "Cannot use --write and --rm together")
 
-    # Parse variables
-    variables = parse_vars(var_args) if var_args else {}
-
     if rm:
         # ===== REMOVE MODE: Delete pattern from Pixelblaze =====
         check(not variables, "Cannot use --var with --rm")
@@ -399,6 +457,9 @@ def pattern(pb: Pixelblaze, input, write_target, rm, img, var_args, no_save, exa
         _handle_render_or_switch_mode(pb, input, variables, no_save, exact)
 
 
+_REGEX_METACHARS = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+
 def _find_pattern(pb: Pixelblaze, search: str, exact: bool = False):
     """Find a pattern by name or ID.
 
@@ -406,7 +467,18 @@ def _find_pattern(pb: Pixelblaze, search: str, exact: bool = False):
         tuple: (pattern_id, pattern_name) or (None, None) if not found
     """
     log("Fetching pattern list...")
-    patterns = pb.getPatternList()
+    patterns, cached = get_pattern_list(pb)
+    match = _match_pattern(patterns, search, exact)
+    if match[0] is None and cached:
+        # The pattern may have been added since the list was cached
+        patterns, _ = get_pattern_list(pb, refresh=True)
+        match = _match_pattern(patterns, search, exact)
+    return match
+
+
+def _match_pattern(patterns, search: str, exact: bool = False):
+    """Match a pattern name or ID against a {pattern_id: pattern_name} list."""
+    from pixelblaze.pixelblaze import Pixelblaze
 
     # Try by ID first
     if Pixelblaze.isPatternId(search):
@@ -417,34 +489,54 @@ def _find_pattern(pb: Pixelblaze, search: str, exact: bool = False):
     if not patterns:
         return (None, None)
 
-    pattern_regex = re.compile(search, re.IGNORECASE)
-
+    # Lowercase each name once; the first pattern wins if two names differ only by case
+    by_name = {}
     for pattern_id, pattern_name in patterns.items():
-        if exact:
-            if pattern_name.lower() == search.lower():
-                return (pattern_id, pattern_name)
-        else:
-            if pattern_regex.search(pattern_name):
-                return (pattern_id, pattern_name)
+        by_name.setdefault(pattern_name.lower(), (pattern_id, pattern_name))
+
+    if exact:
+        return by_name.get(search.lower(), (None, None))
+
+    # Plain words (the usual case) are a case-insensitive substring match, no regex needed
+    if not _REGEX_METACHARS.search(search):
+        search = search.lower()
+        for name, match in by_name.items():
+            if search in name:
+                return match
+        return (None, None)
 
+    pattern_regex = re.compile(search, re.IGNORECASE)
+    for match in by_name.values():
+        if pattern_regex.search(match[1]):
+            return match
     return (None, None)
 
 
 def _handle_remove_mode(pb: Pixelblaze, input, exact):
     """Handle --rm mode: remove pattern from Pixelblaze."""
-    check(not pathlib.Path(input).is_file(), "Cannot use --rm with a file path. Specify pattern name or ID.")
+    check(not is_file_path(input), "Cannot use --rm with a file path. Specify pattern name or ID.")
 
     pattern_id, pattern_name = _find_pattern(pb, input, exact)
     check(pattern_id, f"Pattern '{input}' not found on Pixelblaze")
 
     log(f"Deleting pattern '{pattern_name}' (ID: {pattern_id})...")
     pb.deletePattern(pattern_id)
+    forget_pattern_list(pb)
     log(f"Pattern '{pattern_name}' deleted successfully!")
 
 
+PREVIEW_PLACEHOLDER = pathlib.Path(__file__).parent.parent / 'site/images/preview_placeholder.jpg'
+
+
+@functools.lru_cache(maxsize=1)
+def _placeholder_preview() -> bytes:
+    """The stand-in preview for patterns written without one, read once per process (the daemon may write many)."""
+    return PREVIEW_PLACEHOLDER.read_bytes()
+
+
 def _handle_write_mode(pb: Pixelblaze, input, write_target, img, variables, no_save):
     """Handle --write mode: save pattern to Pixelblaze."""
-    is_file = pathlib.Path(input).is_file()
+    is_file = is_file_path(input)
     code = read_input(input, "code") if is_file else input
 
     # Determine pattern name/ID
@@ -452,7 +544,7 @@ def _handle_write_mode(pb: Pixelblaze, input, write_target, img, variables, no_s
         check(is_file, "Pattern name required when not reading from file. Use: --write NAME")
         pattern_name = pathlib.Path(input).stem
         pattern_id = None
-    elif Pixelblaze.isPatternId(write_target):
+    elif pb.isPatternId(write_target):
         pattern_id, pattern_name = _find_pattern(pb, write_target)
         check(pattern_name, f"Pattern ID {write_target} not found")
     else:
@@ -465,10 +557,11 @@ def _handle_write_mode(pb: Pixelblaze, input, write_target, img, variables, no_s
     log("Compiling pattern...")
     bytecode = pb.compilePattern(code, allow_cache=True)
 
-    img = img or pathlib.Path(__file__).parent.parent / 'site/images/preview_placeholder.jpg'
-    log(f"Loading preview image from {img}...")
-    with open(img, 'rb') as f:
-        preview_image = f.read()
+    if img:
+        log(f"Loading preview image from {img}...")
+        preview_image = pathlib.Path(img).read_bytes()
+    else:
+        preview_image = _placeholder_preview()
 
     log(f"Saving pattern '{pattern_name}' (ID: {pattern_id})...")
     pb.savePattern(
@@ -478,6 +571,7 @@ def _handle_write_mode(pb: Pixelblaze, input, write_target, img, variables, no_s
         name=pattern_name,
         id=pattern_id
     )
+    forget_pattern_list(pb)
 
     log(f"Pattern '{pattern_name}' created successfully!")
     _set_vars_and_controls(pb, variables, not no_save)
@@ -485,7 +579,7 @@ def _handle_write_mode(pb: Pixelblaze, input, write_target, img, variables, no_s
 
 def _handle_render_or_switch_mode(pb: Pixelblaze, input, variables, no_save, exact):
     """Handle render or switch mode based on input type."""
-    if pathlib.Path(input).is_file():
+    if is_file_path(input):
         _render_pattern(pb, read_input(input, "code"), variables)
         return
 
@@ -514,8 +608,10 @@ def _render_pattern(pb: Pixelblaze, code, variables):
     bytecode = pb.compilePattern(code, allow_cache=True)
 
     log("Sending to renderer...")
-    pb.sendPatternToRenderer(bytecode)
-    _set_vars_and_controls(pb, variables)
+    if variables:
+        log(f"Setting variables/controls: {variables}")
+    # Variables and controls go out with the bytecode, rather than in another message once it's running
+    pb.sendPatternToRenderer(bytecode, controls=variables or {}, variables=variables)
 
     log("Pattern rendered successfully")
 
@@ -526,8 +622,7 @@ def _set_vars_and_controls(pb: Pixelblaze, variables, save=False):
         return
 
     log(f"Setting variables/controls: {variables}")
-    pb.setActiveControls(variables, saveToFlash=save)
-    pb.setActiveVariables(variables)
+    pb.setActiveControlsAndVariables(variables, saveToFlash=save)
 
 
 @cli(pixelblaze)
@@ -548,22 +643,29 @@ def cfg(pb: Pixelblaze):
         pb cfg | yq -P          # Pretty-printed YAML
     """
     log("Fetching configurations...")
-    jsons({
-        'config': pb.getConfigSettings(),
-        'patterns': pb.getPatternList(),
-        'playlist': pb.getSequencerPlaylist(),
-        'sequencer': pb.getConfigSequencer()
-    })
+    jsons(pb.getConfigAll())
+
+
+# Friendly --expect names for responses that don't start with their own key
+_EXPECT_ALIASES = {
+    'config': 'name',  # getConfig's settings reply starts with the device name
+    'sequencer': 'activeProgram',
+}
+# ...and for responses that aren't plain JSON replies, by their Pixelblaze.messageTypes name
+_EXPECT_MESSAGE_TYPES = {
+    'stats': 'specialStats',
+    'patterns': 'getProgramList',
+}
 
 
 @cli(pixelblaze)
-@click.argument('json_data', type=str)
+@click.argument('json_data', type=str, callback=json_callback)
 @click.option(
     '--expect',
     type=str,
-    help='Expected response key (e.g., "ack", "playlist")'
+    help='Expected response key (e.g., "ack", "playlist"), or one of: ' + ', '.join([*_EXPECT_ALIASES, *_EXPECT_MESSAGE_TYPES])
 )
-def ws(pb: Pixelblaze, json, expect):
+def ws(pb: Pixelblaze, json_data, expect):
     """
     Send arbitrary JSON to the Pixelblaze websocket.
 
@@ -577,12 +679,11 @@ def ws(pb: Pixelblaze, json, expect):
         pb ws '{activeProgramId:"abc123", save:true}'
         pb ws '{'getPlaylist':"_defaultplaylist_"}' --expect playlist
     """
-    json_obj = parse_json(json)
-
     # Send the websocket message, if no --expect is provided, wait for any non-chatty text response
-    if expect == "stats":
-        expect = pb.messageTypes.specialStats
-    response = pb.wsSendJson(json_obj, expectedResponse=expect, waitForAnyResponse=(expect is None))
+    expect = _EXPECT_ALIASES.get(expect, expect)
+    if expect in _EXPECT_MESSAGE_TYPES:
+        expect = pb.messageTypes[_EXPECT_MESSAGE_TYPES[expect]]
+    response = pb.wsSendJson(json_data, expectedResponse=expect, waitForAnyResponse=(expect is None))
 
     if response is None:
         log("No response (fire-and-forget command?)")
@@ -591,14 +692,18 @@ def ws(pb: Pixelblaze, json, expect):
         click.echo(response.hex())
     else:
         log("Response:")
+        # Pixelblaze replies are JSON objects; anything else is printed as is, without a failed parse first
+        if response[:1] not in ('{', '['):
+            click.echo(response)
+            return
         try:
-            jsons(response)
-        except:
+            jsons(json_loads(response))
+        except ValueError:
             # Not JSON, just print it
             click.echo(response)
 
 
-@click.argument('args', nargs=-1, required=True)
+@click.argument('variables', nargs=-1, required=True, callback=vars_callback, metavar='ARGS...')
 @click.option(
     '--control',
     is_flag=True,
@@ -606,7 +711,7 @@ def ws(pb: Pixelblaze, json, expect):
 )
 @no_save_option
 @cli(pixelblaze)
-def var(pb: Pixelblaze, args, control, no_save):
+def var(pb: Pixelblaze, variables, control, no_save):
     """
     Set variables or UI controls on the active pattern.
 
@@ -630,9 +735,6 @@ def var(pb: Pixelblaze, args, control, no_save):
         pb var --control hue 0.33          # Set UI control
         pb var foo bar --no-save           # Don't save to flash
     """
-    variables = parse_vars(args)
-    check(variables, "No variables specified")
-
     if control:
         log(f"Setting controls: {variables}")
         pb.setActiveControls(variables, saveToFlash=not no_save)
@@ -650,46 +752,51 @@ def var(pb: Pixelblaze, args, control, no_save):
     default=5,
     help='Number of pings to send (default: 5)'
 )
+@click.option('--json', 'as_json', is_flag=True, help='Output the statistics as JSON instead of just the average')
 @cli(pixelblaze)
-def ping(pb: Pixelblaze, count):
+def ping(pb: Pixelblaze, count, as_json):
     """
     Test connection latency to the Pixelblaze.
 
     Sends ping requests and measures round-trip time to determine
     network latency and Pixelblaze responsiveness.
 
+    Normally the pings are pipelined, which is quick but makes each time
+    include waiting behind the pings before it, so only the average is
+    printed. With --json they're sent one at a time, and the output adds
+    the median, p99, jitter (mean difference between consecutive round
+    trips) and standard deviation, in ms.
+
     \b
     Examples:
         pb ping              # Send 5 pings (default)
         pb ping -c 10        # Send 10 pings
         pb ping --count 3    # Send 3 pings
+        pb ping -c 50 --json # Full statistics (p99, jitter, etc.) for scripts
     """
     log(f"Pinging Pixelblaze...\n")
 
-    times = []
-    successful = 0
-    failed = 0
-
-    for i in range(count):
-        try:
-            start = time.time()
-            response = pb.sendPing()
-            elapsed = (time.time() - start) * 1000
-
-            if response is not None:
-                successful += 1
-                times.append(elapsed)
-                log(f"Ping {i+1}: {elapsed:.2f}ms")
-            else:
-                failed += 1
-                log(f"Ping {i+1}: timeout")
-
-            if i < count - 1:
-                time.sleep(0.1)
+    try:
+        if as_json:
+            # One at a time, so each time is a true round trip and the spread statistics measure the link
+            results = [_timed_ping(pb) for _ in range(count)]
+        else:
+            # Pipelined: all are sent up front, then the acknowledgements are timed as they arrive. Quicker, but each
+            # ping's time includes waiting behind the ones before it, so only the average is reported.
+            results = pb.sendPings(count)
+    except Exception as e:
+        results = []
+        log(f"Ping error - {e}")
 
-        except Exception as e:
-            failed += 1
-            log(f"Ping {i+1}: error - {e}")
+    times = []
+    for i, elapsed in enumerate(results):
+        if elapsed is not None:
+            times.append(elapsed * 1000)
+            log(f"Ping {i+1}: {elapsed * 1000:.2f}ms")
+        else:
+            log(f"Ping {i+1}: timeout")
+    successful = len(times)
+    failed = count - successful
 
     if times:
         min_time = min(times)
@@ -700,12 +807,36 @@ def ping(pb: Pixelblaze, count):
         log(f"Packets: Sent = {count}, Received = {successful}, Lost = {failed} ({failed*100//count}% loss)")
         log(f"Round-trip times: min = {min_time:.2f}ms, max = {max_time:.2f}ms, avg = {avg_time:.2f}ms")
 
-        click.echo(f"{avg_time:.2f}")
+        if as_json:
+            import statistics
+
+            # An average hides the occasional slow reply, so also give the median, p99 and spread. Jitter is the
+            # mean difference between consecutive round trips.
+            median_time = statistics.median(times)
+            p99_time = statistics.quantiles(times, n=100, method='inclusive')[98] if len(times) > 1 else times[0]
+            jitter = statistics.mean(abs(b - a) for a, b in zip(times, times[1:])) if len(times) > 1 else 0.0
+            stdev_time = statistics.pstdev(times)
+            log(f"Spread: median = {median_time:.2f}ms, p99 = {p99_time:.2f}ms, "
+                f"jitter = {jitter:.2f}ms, stdev = {stdev_time:.2f}ms")
+            jsons({
+                'sent': count, 'received': successful, 'lost': failed,
+                'min': min_time, 'max': max_time, 'avg': avg_time,
+                'median': median_time, 'p99': p99_time, 'jitter': jitter, 'stdev': stdev_time,
+                'times': [None if elapsed is None else elapsed * 1000 for elapsed in results],
+            })
+        else:
+            click.echo(f"{avg_time:.2f}")
     else:
         log(f"\nAll pings failed")
     check(successful > 0, "Failed to ping Pixelblaze")
 
 
+def _timed_ping(pb: Pixelblaze):
+    """Send one ping and wait for its acknowledgement. Returns the round trip in seconds, or None on timeout."""
+    start = time.perf_counter()
+    return time.perf_counter() - start if pb.sendPing() is not None else None
+
+
 @click.command()
 @click.argument('output_file', required=False)
 @click.option('--ip', default='auto', help='IP address of Pixelblaze')
@@ -733,9 +864,6 @@ def pbb(ctx, output_file, ip, quiet, decode, binary):
         pb pbb -d backup.pbb                        # Decode existing file
         pb pbb -d --binary backup.pbb               # Include binary as base64
     """
-    import pathlib
-    import base64
-
     # Determine the actual file path
     if output_file:
         if not output_file.endswith('.pbb'):
@@ -748,12 +876,13 @@ def pbb(ctx, output_file, ip, quiet, decode, binary):
         should_cleanup = False
     else:
         # Need to fetch from Pixelblaze
-        from pixelblaze.cli_utils import get_pixelblaze
+        from pixelblaze.cli_utils import connect
+        from pixelblaze.pixelblaze import PBB
         ctx.obj = ctx.obj or {}
         ctx.obj['ip'] = ip
 
         log("Creating backup from Pixelblaze...")
-        with get_pixelblaze(ctx) as pb:
+        with connect(ctx) as pb:
             backup = PBB.fromPixelblaze(pb, verbose=not quiet)
 
             if output_file:
@@ -766,69 +895,114 @@ def pbb(ctx, output_file, ip, quiet, decode, binary):
                 should_cleanup = True
 
     # Read and potentially decode the file
-    content = pathlib.Path(temp_file).read_text()
-
-    if decode:
+    data = json_load_file(temp_file) if decode else {}
+    if 'files' in data:
         # Decode base64 entries
-        from pixelblaze.pixelblaze import PBP
-
-        data = jsonlib.loads(content)
-        if 'files' in data:
-            decoded_files = {}
-            for filename, b64_content in data['files'].items():
-                try:
-                    # Decode base64
-                    decoded = base64.b64decode(b64_content)
-
-                    # Check if it's a PBP (Pixelblaze Binary Pattern) file
-                    if filename.startswith('/p/') and len(decoded) > 36:
-                        try:
-                            # Parse PBP format
-                            pbp = PBP.fromBytes(filename.split('/')[-1], decoded)
-                            decoded_files[filename] = {
-                                'name': pbp.name,
-                                'sourceCode': jsonlib.loads(pbp.sourceCode),
-                                'preview': '<jpeg>' if not binary else base64.b64encode(pbp.jpeg).decode('utf-8'),
-                                'byteCode': '<bytecode>' if not binary else base64.b64encode(pbp.byteCode).decode('utf-8')
-                            }
-                            continue
-                        except Exception:
-                            # Not a valid PBP, try other formats
-                            pass
-
-                    # Try to parse as UTF-8 text
-                    try:
-                        text = decoded.decode('utf-8')
-                        # Try to parse as JSON
-                        try:
-                            decoded_files[filename] = jsonlib.loads(text)
-                        except jsonlib.JSONDecodeError:
-                            # Not JSON, just text
-                            decoded_files[filename] = text
-                    except UnicodeDecodeError:
-                        # Binary content (images, etc.)
-                        if binary:
-                            decoded_files[filename] = b64_content
-                        else:
-                            # Detect image format
-                            if decoded.startswith(b'\xff\xd8\xff'):
-                                decoded_files[filename] = '<jpeg>'
-                            elif decoded.startswith(b'\x89PNG'):
-                                decoded_files[filename] = '<png>'
-                            else:
-                                decoded_files[filename] = '<binary>'
-                except Exception:
-                    # If decode fails, keep original
-                    decoded_files[filename] = b64_content
-
-            data['files'] = decoded_files
-            content = jsonlib.dumps(data, indent=2)
-
-    click.echo(content)
+        _echo_decoded_backup(data, binary)
+    else:
+        click.echo(pathlib.Path(temp_file).read_text())
     if should_cleanup:
         pathlib.Path(temp_file).unlink()
 
 
+def _echo_decoded_backup(data, binary):
+    """Write a backup as indented JSON, decoding and writing its files one at a time."""
+    files = data.pop('files')
+    if not files:
+        click.echo(json_dumps({'files': files, **data}, indent=True))
+        return
+
+    # Same layout as json.dumps(indent=2), but each decoded file is written (and freed) before the next is decoded
+    click.echo('{\n  "files": {', nl=False)
+    separator = '\n'
+    for filename in list(files):
+        entry = _decode_backup_file(filename, files.pop(filename), binary)
+        click.echo(f'{separator}    {json_dumps(filename)}: ' + json_dumps(entry, indent=True).replace('\n', '\n    '), nl=False)
+        separator = ',\n'
+    click.echo('\n  }', nl=False)
+    for key, value in data.items():
+        click.echo(f',\n  {json_dumps(key)}: ' + json_dumps(value, indent=True).replace('\n', '\n  '), nl=False)
+    click.echo('\n}')
+
+
+def _decode_backup_file(filename, b64_content, binary):
+    """Decode one base64 backup entry into a pattern summary, JSON, text or a binary placeholder."""
+    import base64
+    from pixelblaze.pixelblaze import PBP
+
+    try:
+        # Images are passed through (or become placeholders) untouched, so identify them from their first bytes
+        # rather than decoding them in full and failing a UTF-8 decode
+        placeholder = _binary_placeholder(base64.b64decode(b64_content[:16]))
+        if placeholder != '<binary>':
+            return b64_content if binary else placeholder
+
+        # Decode base64
+        decoded = base64.b64decode(b64_content)
+
+        # Check if it's a PBP (Pixelblaze Binary Pattern) file
+        if filename.startswith('/p/') and _looks_like_pbp(decoded):
+            try:
+                # Parse PBP format
+                pbp = PBP.fromBytes(filename.split('/')[-1], decoded)
+                return {
+                    'name': pbp.name,
+                    'sourceCode': json_loads(pbp.sourceCode),
+                    'preview': '<jpeg>' if not binary else base64.b64encode(pbp.jpeg).decode('utf-8'),
+                    'byteCode': '<bytecode>' if not binary else base64.b64encode(pbp.byteCode).decode('utf-8')
+                }
+            except Exception:
+                # Not a valid PBP, try other formats
+                pass
+
+        # Try to parse as UTF-8 text
+        try:
+            text = decoded.decode('utf-8')
+            # Try to parse as JSON, unless it can't be (which saves raising an exception for every text file)
+            if not _JSON_START.match(text):
+                return text
+            try:
+                return json_loads(text)
+            except ValueError:
+                # Not JSON, just text
+                return text
+        except UnicodeDecodeError:
+            # Binary content (images, etc.)
+            return b64_content if binary else _binary_placeholder(decoded)
+    except Exception:
+        # If decode fails, keep original
+        return b64_content
+
+
+# What a JSON document can start with, after any whitespace
+_JSON_START = re.compile(r'\s*[{\["\d\-tfn]')
+
+
+def _looks_like_pbp(decoded):
+    """Check that a PBP's header fits the file: it has source code, and its (offset, length) pairs point inside it."""
+    import struct
+
+    if len(decoded) <= 36:
+        return False
+    header = struct.unpack_from('<9I', decoded)
+    if not header[8]:
+        return False
+    for offset, length in zip(header[1::2], header[2::2]):
+        if length and (offset < 36 or offset + length > len(decoded)):
+            return False
+    return True
+
+
+def _binary_placeholder(head):
+    """Describe binary content from its leading bytes: '<jpeg>', '<png>' or '<binary>'."""
+    # Detect image format
+    if head.startswith(b'\xff\xd8\xff'):
+        return '<jpeg>'
+    elif head.startswith(b'\x89PNG'):
+        return '<png>'
+    return '<binary>'
+
+
 @cli(pixelblaze)
 @click.argument('input_file')
 def restore(pb: Pixelblaze, input_file):
@@ -848,6 +1022,8 @@ def restore(pb: Pixelblaze, input_file):
     if not input_file.endswith('.pbb'):
         input_file += '.pbb'
 
+    from pixelblaze.pixelblaze import PBB
+
     log(f"Restoring from {input_file}...")
     backup = PBB.fromFile(input_file)
     backup.toPixelblaze(pb)
@@ -862,8 +1038,8 @@ def cache():
     """
     Manage Pixelblaze CLI cache.
 
-    The cache stores the last used IP address and compiled pattern compilers
-    to speed up CLI operations.
+    The cache stores the last used IP address, compiled pattern compilers and
+    each Pixelblaze's pattern list to speed up CLI operations.
     """
     pass
 
@@ -877,9 +1053,9 @@ def show():
     log("")
 
     # Show IP cache
-    ip_file = cache_dir / 'last_ip.txt'
-    if ip_file.exists():
-        log(f"Cached IP: {ip_file.read_text().strip()}")
+    cached_ip = get_cached_ip()
+    if cached_ip:
+        log(f"Cached IP: {cached_ip}")
     else:
         log("Cached IP: (none)")
 
@@ -898,17 +1074,34 @@ def show():
     else:
         log("\nCached compilers: (none)")
 
+    # Show pattern list caches
+    pattern_caches = get_pattern_cache_files()
+    if pattern_caches:
+        log(f"\nCached pattern lists ({len(pattern_caches)}):")
+        for cache_file in pattern_caches:
+            ip = cache_file.stem[len(PATTERN_CACHE_PREFIX):]
+            try:
+                entry = read_pattern_cache(cache_file)
+            except (OSError, ValueError):
+                log(f"  - {ip} (unreadable, refetched on next use)")
+                continue
+            age_s = max(0, time.time() - entry['fetched'])
+            log(f"  - {ip}: {len(entry['patterns'])} patterns, fetched {age_s / 60:.0f} min ago")
+    else:
+        log("\nCached pattern lists: (none)")
+
 
 @cache.command()
 @click.option('--compiler', is_flag=True, help='Only clear compiler cache')
 @click.option('--ip', is_flag=True, help='Only clear IP cache')
-def clear(compiler, ip):
+@click.option('--patterns', is_flag=True, help='Only clear cached pattern lists')
+def clear(compiler, ip, patterns):
     """Clear the cache."""
     import shutil
 
     cache_dir = get_cache_dir()
 
-    if not compiler and not ip:
+    if not compiler and not ip and not patterns:
         # Clear everything
         if click.confirm(f"Clear all cache in {cache_dir}?", err=True):
             shutil.rmtree(cache_dir, ignore_errors=True)
@@ -916,9 +1109,10 @@ def clear(compiler, ip):
         return
 
     if ip:
-        ip_file = cache_dir / 'last_ip.txt'
-        if ip_file.exists():
-            ip_file.unlink()
+        ip_files = [f for f in (cache_dir / IP_CACHE_FILE, cache_dir / LEGACY_IP_CACHE_FILE) if f.exists()]
+        if ip_files:
+            for ip_file in ip_files:
+                ip_file.unlink()
             log("IP cache cleared")
         else:
             log("No IP cache to clear")
@@ -931,9 +1125,142 @@ def clear(compiler, ip):
         else:
             log("No compiler cache to clear")
 
+    if patterns:
+        pattern_caches = get_pattern_cache_files()
+        for cache_file in pattern_caches:
+            cache_file.unlink(missing_ok=True)
+        log(f"Cleared {len(pattern_caches)} cached pattern list(s)" if pattern_caches else "No pattern lists to clear")
+
+
+@pixelblaze.group()
+def daemon():
+    """
+    Keep a Pixelblaze connection open in the background.
+
+    While the daemon is running, other pb commands are handed to it instead of
+    opening (and tearing down) their own websocket, which makes short commands
+    much faster. Commands reading piped stdin, or given a different --ip (or
+    --timeout/--no-cache), still run directly.
+
+    \b
+    Examples:
+        pb daemon start        # Start in the background
+        pb on; pb off          # Both reuse the daemon's connection
+        pb daemon stop
+    """
+    pass
+
+
+@daemon.command()
+@click.option('--foreground', is_flag=True, help='Run in the foreground instead of detaching')
+@click.pass_context
+def start(ctx, foreground):
+    """Start the daemon."""
+    import subprocess
+    from pixelblaze import cli_daemon
+
+    check(ctx.obj['ip'] != 'all' and ',' not in ctx.obj['ip'], "The daemon connects to a single Pixelblaze")
+    check(cli_daemon.is_supported(), "The daemon requires Unix domain sockets, which aren't available here")
+    check(not cli_daemon.is_running(), "Daemon is already running")
+
+    if foreground:
+        cli_daemon.serve(ctx.obj['ip'], use_cache=not ctx.obj['no_cache'])
+        return
+
+    root_args = ['--ip', ctx.obj['ip']] + (['--no-cache'] if ctx.obj['no_cache'] else [])
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'pixelblaze.cli', *root_args, 'daemon', 'start', '--foreground'],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    # Wait for discovery and the websocket connection before reporting back
+    deadline = time.time() + ctx.obj['timeout'] + BEACON_TIMEOUT_MS / 1000
+    while time.time() < deadline and process.poll() is None:
+        if cli_daemon.is_running():
+            log(f"Daemon started (pid {process.pid})")
+            return
+        time.sleep(0.1)
+    check(False, "Daemon failed to start, try `pb daemon start --foreground` to see why")
+
+
+@daemon.command()
+def stop():
+    """Stop the daemon."""
+    from pixelblaze import cli_daemon
+
+    check(cli_daemon.stop(), "Daemon is not running")
+    log("Daemon stopped")
+
+
+@daemon.command()
+def status():
+    """Show whether the daemon is running."""
+    from pixelblaze import cli_daemon
+
+    click.echo("running" if cli_daemon.is_running() else "stopped")
+
+
+@pixelblaze.command()
+@click.pass_context
+def shell(ctx):
+    """
+    Run pb commands interactively over one connection.
+
+    Reads one command per line (without the leading `pb`) until end of input
+    or `exit`. Every command reuses the same websocket, so this is also a
+    quick way to script several commands in a row.
+
+    \b
+    Examples:
+        pb shell
+        printf 'on 0.5\\npattern rainbow\\n' | pb shell
+    """
+    import shlex
+    from pixelblaze.cli_utils import connect
+
+    check(ctx.obj['ip'] != 'all' and ',' not in ctx.obj['ip'], "The shell connects to a single Pixelblaze")
+    interactive = sys.stdin.isatty()
+
+    with connect(ctx) as pb:
+        while True:
+            try:
+                line = input('pb> ' if interactive else '')
+            except EOFError:
+                break
+            except KeyboardInterrupt:
+                click.echo()
+                continue
+            try:
+                args = shlex.split(line, comments=True)
+            except ValueError as e:
+                log(f"Error: {e}")
+                continue
+            if not args:
+                continue
+            if args[0] in ('exit', 'quit'):
+                break
+            if args[0] in ('shell', 'daemon'):
+                log(f"Error: `{args[0]}` can't be run from the shell")
+                continue
+            try:
+                # stdin is where the commands come from, so it's never input for one of them
+                obj = {'pixelblaze': pb, 'no_stdin': True}
+                pixelblaze.main(args=args, prog_name='pb', obj=obj, standalone_mode=False)
+            except click.ClickException as e:
+                e.show()
+            except click.Abort:
+                log("Aborted!")
+            except Exception as e:
+                log(f"Error: {e}")
+
 
 def main():
     """Entry point for the CLI."""
+    from pixelblaze import cli_daemon
+
+    exit_code = cli_daemon.forward(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
     pixelblaze(obj={})
 
 
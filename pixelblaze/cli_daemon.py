@@ -0,0 +1,239 @@
+"""Background daemon that keeps one Pixelblaze connection open across CLI invocations."""
+
+import io
+import os
+import sys
+import json
+import socket
+import pathlib
+import traceback
+import contextlib
+import click
+from typing import Optional
+from pixelblaze.cli_utils import get_cache_dir, discover_pixelblaze, log
+
+DAEMON_SOCKET_FILE = 'daemon.sock'
+# Commands that never touch a Pixelblaze, manage the daemon itself or hold their own connection always run in-process
+LOCAL_COMMANDS = ('daemon', 'cache', 'shell')
+# Root options that take a value, needed to find the subcommand name in argv
+ROOT_VALUE_OPTIONS = ('--ip', '--timeout')
+
+
+def get_socket_path() -> pathlib.Path:
+    """Get the daemon's Unix socket path, preferring the per-user runtime directory."""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return pathlib.Path(runtime_dir) / f'pixelblaze-{DAEMON_SOCKET_FILE}'
+    return get_cache_dir() / DAEMON_SOCKET_FILE
+
+
+def is_supported() -> bool:
+    """The daemon needs Unix domain sockets (not available on older Windows Pythons)."""
+    return hasattr(socket, 'AF_UNIX')
+
+
+def _connect(timeout: Optional[float] = None) -> Optional[socket.socket]:
+    """Connect to a running daemon, or return None if there isn't one."""
+    if not is_supported():
+        return None
+    socket_path = get_socket_path()
+    if not socket_path.exists():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(str(socket_path))
+        return sock
+    except OSError:
+        sock.close()
+        return None
+
+
+def _request(sock: socket.socket, message: dict) -> dict:
+    """Send one newline-delimited JSON request and read the daemon's JSON reply."""
+    with sock, sock.makefile('rwb') as stream:
+        stream.write(json.dumps(message).encode('utf-8') + b'\n')
+        stream.flush()
+        reply = stream.readline()
+    return json.loads(reply) if reply else {}
+
+
+def _split_root_args(args):
+    """Returns ({root option: value}, subcommand name, subcommand args) from the CLI's argv."""
+    options, i = {}, 0
+    while i < len(args):
+        arg = args[i]
+        if arg in ROOT_VALUE_OPTIONS:
+            options[arg] = args[i + 1] if i + 1 < len(args) else None
+            i += 2
+            continue
+        if arg.startswith('--') and '=' in arg:
+            name, value = arg.split('=', 1)
+            options[name] = value
+        elif arg.startswith('-'):
+            options[arg] = True
+        else:
+            return options, arg, args[i + 1:]
+        i += 1
+    return options, None, []
+
+
+def _forwardable_ip(args) -> Optional[str]:
+    """
+    Check whether a CLI invocation can run on the daemon's connection.
+
+    Returns:
+        str: The --ip it asks for (or "auto"), or None if it has to run in-process
+    """
+    options, command, command_args = _split_root_args(args)
+    if command is None or command in LOCAL_COMMANDS:
+        return None
+    # The daemon's connection is already made, so anything about making one (--timeout, --no-cache, or a
+    # subcommand's own --ip like pbb's) would be silently ignored there
+    if set(options) - {'--ip'}:
+        return None
+    if any(arg == '--ip' or arg.startswith('--ip=') for arg in command_args):
+        return None
+    return options.get('--ip') or os.environ.get('PB_IP') or 'auto'
+
+
+def forward(args) -> Optional[int]:
+    """
+    Run a CLI invocation on the daemon, if one is running and can handle it.
+
+    Args:
+        args: The CLI arguments (without the program name)
+
+    Returns:
+        int: The command's exit code, after replaying its stdout/stderr, or
+        None if the command should run in-process instead
+    """
+    ip = _forwardable_ip(args)
+    # Piped stdin can't be forwarded, so commands reading input that way run in-process
+    if ip is None or not sys.stdin.isatty():
+        return None
+    sock = _connect()
+    if sock is None:
+        return None
+    try:
+        reply = _request(sock, {'args': list(args), 'ip': ip, 'cwd': os.getcwd()})
+    except (OSError, ValueError):
+        return None
+    if 'exit_code' not in reply:
+        # e.g. the daemon is holding a different Pixelblaze than the one asked for
+        return None
+    sys.stdout.write(reply.get('stdout', ''))
+    sys.stderr.write(reply.get('stderr', ''))
+    return reply['exit_code']
+
+
+def _run_command(pb, args) -> dict:
+    """Run CLI args against the shared Pixelblaze, capturing output and exit code."""
+    from pixelblaze.cli import pixelblaze
+
+    stdout, stderr = io.StringIO(), io.StringIO()
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            # Only commands run from a terminal are forwarded, so there's never piped input for them to read
+            obj = {'pixelblaze': pb, 'no_stdin': True}
+            rv = pixelblaze.main(args=args, prog_name='pb', obj=obj, standalone_mode=False)
+            exit_code = rv if isinstance(rv, int) else 0
+        except click.ClickException as e:
+            e.show()
+            exit_code = e.exit_code
+        except click.Abort:
+            click.echo("Aborted!", err=True)
+            exit_code = 1
+        except Exception:
+            traceback.print_exc()
+            exit_code = 1
+    return {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(), 'exit_code': exit_code}
+
+
+def _handle_request(pb, stream) -> bool:
+    """
+    Read one request from a client and write the reply, without letting a bad request stop the daemon.
+
+    Returns:
+        bool: True if the client asked the daemon to stop
+    """
+    try:
+        request = json.loads(stream.readline())
+    except ValueError:
+        return False
+    if not isinstance(request, dict):
+        reply = {'error': "Request must be a JSON object"}
+    elif request.get('stop'):
+        stream.write(b'{}\n')
+        return True
+    elif request.get('ip', 'auto') not in ('auto', pb.ipAddress):
+        reply = {'error': f"Daemon is connected to {pb.ipAddress}"}
+    elif not isinstance(request.get('args', []), list) or not all(isinstance(a, str) for a in request.get('args', [])):
+        reply = {'error': "Request args must be a list of strings"}
+    else:
+        try:
+            os.chdir(request.get('cwd', '/'))
+            reply = _run_command(pb, request.get('args', []))
+        except Exception as e:
+            reply = {'error': str(e)}
+    stream.write(json.dumps(reply).encode('utf-8') + b'\n')
+    return False
+
+
+def serve(ip_address: str, use_cache: bool = True):
+    """
+    Hold a Pixelblaze connection open and run forwarded CLI commands on it until stopped.
+
+    Args:
+        ip_address: Either an explicit IP or "auto"
+        use_cache: Whether auto discovery tries the last used IP first
+    """
+    from pixelblaze.pixelblaze import Pixelblaze
+
+    socket_path = get_socket_path()
+    if is_running():
+        raise click.ClickException(f"Daemon already running on {socket_path}")
+    socket_path.unlink(missing_ok=True)  # Stale socket from a daemon that didn't shut down cleanly
+
+    with Pixelblaze(discover_pixelblaze(ip_address, use_cache=use_cache)) as pb:
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Create the socket owner-only from the start; a chmod after bind() leaves a window where others can connect
+        umask = os.umask(0o077)
+        try:
+            listener.bind(str(socket_path))
+        finally:
+            os.umask(umask)
+        listener.listen()
+        log(f"Daemon holding Pixelblaze at {pb.ipAddress}, listening on {socket_path}")
+
+        try:
+            # Commands run one at a time, the Pixelblaze connection isn't shared between threads
+            while True:
+                conn, _ = listener.accept()
+                try:
+                    with conn, conn.makefile('rwb') as stream:
+                        if _handle_request(pb, stream):
+                            break
+                except OSError as e:
+                    log(f"Client connection failed: {e}")  # e.g. the client went away before reading its reply
+        finally:
+            listener.close()
+            socket_path.unlink(missing_ok=True)
+
+
+def stop() -> bool:
+    """Ask a running daemon to shut down. Returns False if none was running."""
+    sock = _connect(timeout=5)
+    if sock is None:
+        return False
+    _request(sock, {'stop': True})
+    return True
+
+
+def is_running() -> bool:
+    """Check whether a daemon is accepting connections."""
+    sock = _connect(timeout=1)
+    if sock is None:
+        return False
+    sock.close()
+    return True
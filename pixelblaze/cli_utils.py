@@ -1,21 +1,78 @@
 """CLI utilities for Pixelblaze controller."""
 
+from __future__ import annotations
+
+import io
+import os
 import sys
-import socket
+import time
+import threading
 import click
-import json5
 import json
 import pathlib
-from functools import wraps
-from typing import Callable, Optional
-from pixelblaze.pixelblaze import Pixelblaze
+from functools import lru_cache, wraps
+from contextlib import closing, contextmanager
+from typing import Callable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pixelblaze.pixelblaze import Pixelblaze
+
+try:
+    import orjson  # Optional C-accelerated JSON, installed with `pip install pixelblaze-client[fast]`
+except ImportError:
+    orjson = None
+
+
+def json_dumps(obj, indent: bool = False) -> str:
+    """Serialize to compact JSON (or indented by 2 spaces), using orjson when it's installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)).decode()
+    # orjson writes non-ASCII as UTF-8 rather than \u escapes, so match it whichever is installed
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+def json_loads(text):
+    """Parse strict JSON, using orjson when it's installed. Raises ValueError if invalid."""
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def json_load_file(path):
+    """Parse a JSON file. With orjson, it's parsed straight from a read-only memory map rather than a str copy."""
+    with open(path, 'rb') as f:
+        if orjson is None or os.fstat(f.fileno()).st_size == 0:
+            return json.loads(f.read())
+        import mmap
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            # Skip a UTF-8 byte order mark, which orjson doesn't accept
+            return orjson.loads(view[3:] if view[:3] == b'\xef\xbb\xbf' else view)
+
 
 log = lambda *args, **kwargs: click.echo(*args, err=True, *kwargs)
-jsons = lambda x: click.echo(json.dumps(x, separators=(',', ':')))
+jsons = lambda x: click.echo(json_dumps(x))
+
+# Pixelblazes in ad-hoc (AP) mode always live at this address
+ADHOC_IP = "192.168.4.1"
+# Pixelblazes broadcast a UDP beacon about once per second, so this covers at least one beacon
+BEACON_TIMEOUT_MS = 1500
+
+# Discovery cache: the last Pixelblaze found, and how long we keep trusting it
+IP_CACHE_FILE = 'last_ip.json'
+LEGACY_IP_CACHE_FILE = 'last_ip.txt'
+IP_CACHE_MAX_AGE = 7 * 24 * 60 * 60  # seconds
+# ...and how stale last_seen may get before it's rewritten, so back-to-back commands don't each write the file
+IP_CACHE_REFRESH_AGE = 60 * 60  # seconds
+# The cached and ad-hoc IPs are probed together; a Pixelblaze on the local network answers well within this
+PROBE_TIMEOUT = 1  # seconds
+
+# Pattern lists are cached per device; patterns can also change from the web UI, so keep this short
+PATTERN_CACHE_MAX_AGE = 5 * 60  # seconds
 
 
+@lru_cache(maxsize=1)
 def get_cache_dir():
-    """Get the cache directory for Pixelblaze CLI, creating it if needed."""
+    """Get the cache directory for Pixelblaze CLI, creating it if needed (once per process)."""
     # Use ~/.config/pixelblaze on Unix-like systems, ~/AppData/Local/pixelblaze on Windows
     if sys.platform == 'win32':
         cache_dir = pathlib.Path.home() / 'AppData' / 'Local' / 'pixelblaze'
@@ -27,25 +84,133 @@ def get_cache_dir():
     return cache_dir
 
 
-def get_cached_ip():
-    """Get the last used IP from cache."""
+def _read_ip_cache() -> dict:
+    cache_dir = get_cache_dir()
     try:
-        cache_file = get_cache_dir() / 'last_ip.txt'
-        if cache_file.exists():
-            return cache_file.read_text().strip()
+        entry = json_loads((cache_dir / IP_CACHE_FILE).read_bytes())
+    except FileNotFoundError:
+        return _migrate_legacy_ip_cache(cache_dir)
     except Exception:
+        entry = None
+    try:
+        # The current file wins; a leftover from an older version (e.g. one that ran after we migrated) is just stale.
+        (cache_dir / LEGACY_IP_CACHE_FILE).unlink(missing_ok=True)
+    except OSError:
         pass
+    return entry if isinstance(entry, dict) else {}  # e.g. edited by hand
+
+
+def _migrate_legacy_ip_cache(cache_dir: pathlib.Path) -> dict:
+    """Move an IP cached by older versions (plain text, without a timestamp) into the current cache file, once."""
+    legacy_file = cache_dir / LEGACY_IP_CACHE_FILE
+    try:
+        entry = {'ip': legacy_file.read_text().strip(), 'last_seen': legacy_file.stat().st_mtime}
+        if entry['ip']:
+            write_cache_file(cache_dir / IP_CACHE_FILE, entry)
+        legacy_file.unlink()
+    except OSError:
+        return {}
+    return entry if entry['ip'] else {}
+
+
+def get_cached_ip():
+    """Get the last used IP from cache, unless it hasn't been seen for a while."""
+    entry = _read_ip_cache()
+    if time.time() - entry.get('last_seen', 0) < IP_CACHE_MAX_AGE:
+        return entry.get('ip')
     return None
 
 
 def cache_ip(ip_address):
     """Cache the IP address for future use."""
+    entry = _read_ip_cache()
+    if entry.get('ip') == ip_address and time.time() - entry.get('last_seen', 0) < IP_CACHE_REFRESH_AGE:
+        return
     try:
-        cache_file = get_cache_dir() / 'last_ip.txt'
-        cache_file.write_text(ip_address)
+        write_cache_file(get_cache_dir() / IP_CACHE_FILE, {'ip': ip_address, 'last_seen': time.time()})
     except Exception:
         pass
 
+
+def write_cache_file(cache_file: pathlib.Path, data):
+    """Write JSON to a cache file, via a temp file renamed over it so a crash can't leave it half-written."""
+    temp_file = cache_file.with_suffix('.tmp')
+    temp_file.write_text(json_dumps(data))
+    os.replace(temp_file, cache_file)
+
+
+# Parsed pattern cache files, keyed by path, as (mtime_ns, entry); saves re-parsing them in a long-lived process
+_pattern_cache_entries = {}
+
+
+PATTERN_CACHE_PREFIX = 'patterns-'
+
+
+def _pattern_cache_file(pb: Pixelblaze) -> pathlib.Path:
+    return get_cache_dir() / f'{PATTERN_CACHE_PREFIX}{pb.ipAddress}.json'
+
+
+def get_pattern_cache_files() -> list:
+    """Get every cached pattern list file, one per Pixelblaze IP."""
+    return sorted(get_cache_dir().glob(f'{PATTERN_CACHE_PREFIX}*.json'))
+
+
+def read_pattern_cache(cache_file: pathlib.Path) -> dict:
+    """
+    Read a cached pattern list file, as {'fetched': timestamp, 'patterns': {pattern_id: pattern_name}}.
+
+    Raises:
+        OSError: If the file can't be read
+        ValueError: If it isn't a pattern list cache (corrupt, or edited by hand)
+    """
+    mtime = cache_file.stat().st_mtime_ns
+    memo = _pattern_cache_entries.get(cache_file)
+    if memo is None or memo[0] != mtime:
+        entry = json_loads(cache_file.read_bytes())
+        if not (isinstance(entry, dict) and isinstance(entry.get('patterns'), dict)
+                and isinstance(entry.get('fetched'), (int, float))):
+            raise ValueError(f"Not a pattern list cache: {cache_file}")
+        memo = (mtime, entry)
+        _pattern_cache_entries[cache_file] = memo
+    return memo[1]
+
+
+def get_pattern_list(pb: Pixelblaze, refresh: bool = False):
+    """
+    Get the Pixelblaze's pattern list, from a short-lived on-disk cache if possible.
+
+    Args:
+        pb: Connected Pixelblaze instance
+        refresh: Skip the cache and fetch a fresh list
+
+    Returns:
+        tuple: ({pattern_id: pattern_name}, True if the list came from the cache)
+    """
+    cache_file = _pattern_cache_file(pb)
+    if not refresh:
+        try:
+            entry = read_pattern_cache(cache_file)
+            if time.time() - entry['fetched'] < PATTERN_CACHE_MAX_AGE:
+                return entry['patterns'], True
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError):
+            forget_pattern_list(pb)  # Unreadable or corrupt, so drop it and fetch a fresh list
+
+    patterns = pb.getPatternList(forceRefresh=refresh)
+    try:
+        write_cache_file(cache_file, {'fetched': time.time(), 'patterns': patterns})
+    except OSError:
+        pass
+    return patterns, False
+
+
+def forget_pattern_list(pb: Pixelblaze):
+    """Drop the cached pattern list, e.g. after adding or removing a pattern."""
+    cache_file = _pattern_cache_file(pb)
+    _pattern_cache_entries.pop(cache_file, None)
+    cache_file.unlink(missing_ok=True)
+
 # Reusable Click options
 no_save_option = click.option(
     '--no-save',
@@ -56,12 +221,13 @@ no_save_option = click.option(
 # Reusable Click arguments
 input_arg = click.argument('input', required=False)
 
-def discover_pixelblaze(ip_address: str) -> str:
+def discover_pixelblaze(ip_address: str, use_cache: bool = True) -> str:
     """
     Discovers a Pixelblaze IP address using the specified strategy.
 
     Args:
         ip_address: Either an explicit IP, "auto", or None
+        use_cache: Whether to try the last used IP first (whatever is found is cached either way)
 
     Returns:
         str: The discovered or specified IP address
@@ -73,54 +239,190 @@ def discover_pixelblaze(ip_address: str) -> str:
         cache_ip(ip_address)  # Cache explicitly provided IP
         return ip_address
 
-    # Try cached IP first
-    cached_ip = get_cached_ip()
-    if cached_ip:
-        click.echo(f"Trying cached IP {cached_ip}...", err=True)
+    # Start listening for beacons straight away, so if neither probe below answers we've already been listening
+    # for a while. Pixelblazes don't advertise over mDNS; their UDP beacon is the equivalent announcement, and the
+    # enumerator returns as soon as the first one arrives.
+    # (A daemon thread, so finding a Pixelblaze by probing doesn't leave the process waiting for it at exit.)
+    beacon = {}
+    listener = threading.Thread(target=_listen_for_beacon, args=(beacon,), daemon=True)
+    listener.start()
+
+    # Meanwhile probe the last used IP and ad-hoc mode (192.168.4.1) together, preferring the cached IP
+    cached_ip = get_cached_ip() if use_cache else None
+    candidates = [cached_ip] if cached_ip and cached_ip != ADHOC_IP else []
+    candidates.append(ADHOC_IP)
+    click.echo(f"Checking for Pixelblaze at {' and '.join(candidates)}...", err=True)
+    found_ip = _probe_first(candidates, PROBE_TIMEOUT)
+    if found_ip:
+        click.echo(f"Found Pixelblaze at {found_ip}" + (" (cached)" if found_ip == cached_ip else ""), err=True)
+        cache_ip(found_ip)
+        return found_ip
+
+    click.echo("Listening for Pixelblaze beacons on network...", err=True)
+    listener.join()
+    if 'error' in beacon:
+        click.echo(f"Enumeration failed: {beacon['error']}", err=True)
+    elif beacon.get('ip'):
+        click.echo(f"Found Pixelblaze at {beacon['ip']}", err=True)
+        cache_ip(beacon['ip'])
+        return beacon['ip']
+
+    raise click.ClickException(
+        "No Pixelblaze found. Specify an IP address with --ip or ensure a Pixelblaze is on the network."
+    )
+
+
+def _probe_first(ip_addresses: list, timeout: float) -> Optional[str]:
+    """
+    Probe several IPs for a Pixelblaze's web server at once.
+
+    Args:
+        ip_addresses: The IPs to try, most preferred first
+        timeout: How long to wait for any of them, in seconds
+
+    Returns:
+        str: The most preferred IP among the first to accept a connection, or None if none did in time
+    """
+    import select
+    import socket
+
+    pending = {}
+    for ip in ip_addresses:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(1)
-            result = sock.connect_ex((cached_ip, 80))
+            sock.connect_ex((ip, 80))
+            pending[sock] = ip
+        except OSError:
             sock.close()
 
-            if result == 0:
-                click.echo(f"Found Pixelblaze at {cached_ip} (cached)", err=True)
-                return cached_ip
-        except Exception:
-            pass
-        click.echo(f"Cached IP {cached_ip} not responding, searching...", err=True)
+    deadline = time.monotonic() + timeout
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            _, ready, _ = select.select([], list(pending), [], remaining)
+            connected = []
+            for sock in ready:
+                ip = pending.pop(sock)
+                if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    connected.append(ip)
+                sock.close()
+            if connected:
+                return min(connected, key=ip_addresses.index)
+        return None
+    finally:
+        for sock in pending:
+            sock.close()
 
-    # Try ad-hoc mode first (192.168.4.1)
-    adhoc_ip = "192.168.4.1"
-    click.echo(f"Checking for Pixelblaze in ad-hoc mode at {adhoc_ip}...", err=True)
 
+def _listen_for_beacon(result: dict):
+    """Wait for the first Pixelblaze beacon, storing its IP (or the error) in result['ip'] (or result['error'])."""
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(1)
-        result = sock.connect_ex((adhoc_ip, 80))
-        sock.close()
-
-        if result == 0:
-            click.echo(f"Found Pixelblaze at {adhoc_ip}", err=True)
-            cache_ip(adhoc_ip)
-            return adhoc_ip
+        from pixelblaze.pixelblaze import Pixelblaze
+        # Close the listening socket as soon as the first beacon arrives, rather than whenever it's collected
+        with closing(Pixelblaze.EnumerateAddresses(timeout=BEACON_TIMEOUT_MS)) as enumerator:
+            result['ip'] = next(enumerator, None)
     except Exception as e:
-        click.echo(f"Ad-hoc check failed: {e}", err=True)
+        result['error'] = e
+
+
+def expand_ips(ip_address: str) -> list:
+    """
+    Expand an --ip value naming several Pixelblazes into their IP addresses.
+
+    Args:
+        ip_address: Comma-separated IPs, "all" for every Pixelblaze heard beaconing, or a single IP/"auto"
+
+    Returns:
+        list: The IP addresses, or an empty list if ip_address names a single Pixelblaze
+
+    Raises:
+        click.ClickException: If "all" finds no Pixelblazes
+    """
+    if ip_address == "all":
+        from pixelblaze.pixelblaze import Pixelblaze
+        log("Listening for Pixelblaze beacons on network...")
+        with closing(Pixelblaze.EnumerateAddresses(timeout=BEACON_TIMEOUT_MS)) as enumerator:
+            found = list(enumerator)
+        check(found, "No Pixelblazes found on the network.")
+        log(f"Found {len(found)} Pixelblaze(s): {', '.join(found)}")
+        return found
+    if ip_address and ',' in ip_address:
+        return [ip.strip() for ip in ip_address.split(',') if ip.strip()]
+    return []
+
+
+class _PerThreadOutput(io.TextIOBase):
+    """Stands in for sys.stdout/sys.stderr, sending writes from a thread with a buffer set to that buffer instead."""
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        return getattr(self.local, 'buffer', self.stream).write(text)
 
-    # Fall back to enumerator
-    click.echo("Searching for Pixelblazes on network...", err=True)
+    def flush(self):
+        getattr(self.local, 'buffer', self.stream).flush()
 
+
+def run_on_each(ips: list, func: Callable, *args, **kwargs):
+    """
+    Run a command on several Pixelblazes at once, each on its own connection and thread.
+
+    Each Pixelblaze's output is collected and written once they've all finished, in the order of ips, with every
+    line labelled with its IP: "<ip>\t<line>" on stdout, "<ip>: <line>" on stderr.
+
+    Args:
+        ips: IP addresses of the Pixelblazes
+        func: Command function, called as func(pb, *args, **kwargs)
+
+    Raises:
+        click.ClickException: If the command failed on any of them
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from pixelblaze.pixelblaze import Pixelblaze
+
+    outputs = {ip: (io.StringIO(), io.StringIO()) for ip in ips}
+    stdout, stderr = _PerThreadOutput(sys.stdout), _PerThreadOutput(sys.stderr)
+
+    def run_one(ip):
+        stdout.local.buffer, stderr.local.buffer = outputs[ip]
+        with Pixelblaze(ip) as pb:
+            return func(pb, *args, **kwargs)
+
+    sys.stdout, sys.stderr = stdout, stderr
     try:
-        for found_ip in Pixelblaze.EnumerateAddresses(timeout=2000):
-            click.echo(f"Found Pixelblaze at {found_ip}", err=True)
-            cache_ip(found_ip)
-            return found_ip
-    except Exception as e:
-        click.echo(f"Enumeration failed: {e}", err=True)
+        with ThreadPoolExecutor(max_workers=len(ips)) as pool:
+            futures = {ip: pool.submit(run_one, ip) for ip in ips}
+    finally:
+        sys.stdout, sys.stderr = stdout.stream, stderr.stream
+
+    failed = []
+    for ip, future in futures.items():
+        out, err = outputs[ip]
+        for line in err.getvalue().splitlines():
+            log(f"{ip}: {line}")
+        for line in out.getvalue().splitlines():
+            click.echo(f"{ip}\t{line}")
+        error = future.exception()
+        if error is not None:
+            log(f"{ip}: {error}")
+            failed.append(ip)
+    check(not failed, f"Failed on {len(failed)} of {len(ips)} Pixelblazes: {', '.join(failed)}")
+
+
+def is_file_path(value: str) -> bool:
+    """
+    Check whether an INPUT-style argument names an existing file, rather than being inline content.
 
-    raise click.ClickException(
-        "No Pixelblaze found. Specify an IP address with --ip or ensure a Pixelblaze is on the network."
-    )
+    Multi-line text is inline code without asking the filesystem, and text too long to be a path is too
+    (os.path.isfile() returns False for that, where pathlib raises "File name too long").
+    """
+    return '\n' not in value and os.path.isfile(value)
 
 
 def read_input(value: Optional[str], name: str = "input", required: bool = True) -> str:
@@ -131,7 +433,7 @@ def read_input(value: Optional[str], name: str = "input", required: bool = True)
       - If it's an existing file path, read the file
       - Otherwise, treat it as the content itself
     If value is None:
-      - If stdin is available (not a TTY), read from stdin
+      - If stdin is available (not a TTY, and not flagged as unavailable with ctx.obj['no_stdin']), read from stdin
       - Otherwise, raise an error
 
     Args:
@@ -144,19 +446,21 @@ def read_input(value: Optional[str], name: str = "input", required: bool = True)
     Raises:
         click.ClickException: If no input provided
     """
-    import os
-
+    # Files and stdin are read as bytes and decoded once as UTF-8 (skipping any BOM), whatever the platform's
+    # default encoding is; pattern sources saved from the web UI are UTF-8.
     if value is not None:
         # Check if it's an existing file path
-        if os.path.isfile(value):
-            with open(value, 'r') as f:
-                return f.read().strip()
+        if is_file_path(value):
+            return pathlib.Path(value).read_bytes().decode('utf-8-sig').strip()
         # Otherwise treat it as the content itself
         return value
 
-    # No value provided, try stdin
-    if not sys.stdin.isatty():
-        return sys.stdin.read().strip()
+    # No value provided, try stdin. The daemon and `pb shell` run commands with no_stdin set: the daemon's stdin
+    # is /dev/null, and the shell's is the script it's reading commands from.
+    ctx = click.get_current_context(silent=True)
+    no_stdin = ctx is not None and ctx.obj is not None and ctx.obj.get('no_stdin')
+    if not no_stdin and not sys.stdin.isatty():
+        return sys.stdin.buffer.read().decode('utf-8-sig').strip()
 
     if required:
         raise click.ClickException(
@@ -168,7 +472,7 @@ def read_input(value: Optional[str], name: str = "input", required: bool = True)
 
 def parse_json(text: str):
     """
-    Parse JSON-like text using json5 (supports single quotes, unquoted keys, etc).
+    Parse JSON-like text, falling back to json5 (supports single quotes, unquoted keys, etc) if it isn't strict JSON.
 
     Args:
         text: JSON5 string to parse
@@ -179,6 +483,16 @@ def parse_json(text: str):
     Raises:
         click.ClickException: If parsing fails
     """
+    try:
+        return json_loads(text)  # Strict JSON is also JSON5, and far quicker to parse
+    except ValueError:
+        pass
+
+    try:
+        import pyjson5 as json5  # Cython JSON5 parser, installed with `pip install pixelblaze-client[fast]`
+    except ImportError:
+        import json5
+
     try:
         return json5.loads(text)
     except Exception as e:
@@ -204,6 +518,30 @@ def check(condition, error_message: str):
         raise click.ClickException(error_message)
 
 
+def vars_callback(ctx, param, value):
+    """
+    Click callback that parses variable arguments with parse_vars().
+
+    Parsing them while click handles the command line means bad input fails before connecting to the Pixelblaze.
+
+    Raises:
+        click.ClickException: If parsing fails, or a required parameter yields no variables
+    """
+    variables = parse_vars(value) if value else {}
+    check(variables or not param.required, "No variables specified")
+    return variables
+
+
+def json_callback(ctx, param, value):
+    """
+    Click callback that parses a JSON/JSON5 argument with parse_json(), so bad input fails before connecting.
+
+    Raises:
+        click.ClickException: If parsing fails
+    """
+    return parse_json(value) if value is not None else None
+
+
 def parse_vars(args):
     """
     Parse variable arguments in flexible formats.
@@ -248,8 +586,8 @@ def parse_vars(args):
                 pass
 
         # Check for colon-separated key:value
-        if ':' in arg:
-            key, value = arg.split(':', 1)
+        key, colon, value = arg.partition(':')
+        if colon:
             try:
                 variables[key] = float(value)
             except ValueError:
@@ -283,13 +621,34 @@ def get_pixelblaze(ctx: click.Context) -> Pixelblaze:
     Raises:
         click.ClickException: If connection fails
     """
+    if ctx.obj.get('pixelblaze') is not None:
+        return ctx.obj['pixelblaze']  # Shared connection, e.g. held open by `pb daemon`
+
     ip_address = ctx.obj['ip']
 
-    discovered_ip = discover_pixelblaze(ip_address)
+    from pixelblaze.pixelblaze import Pixelblaze
+
+    discovered_ip = discover_pixelblaze(ip_address, use_cache=not ctx.obj.get('no_cache'))
     ctx.obj['ip'] = discovered_ip  # Update with actual IP used
-    pb = Pixelblaze(discovered_ip)
-    ctx.obj['pixelblaze'] = pb
-    return pb
+    return Pixelblaze(discovered_ip)
+
+
+@contextmanager
+def connect(ctx: click.Context):
+    """
+    Context manager yielding a connected Pixelblaze, closed on exit unless it's a shared connection.
+
+    Args:
+        ctx: Click context containing the IP address (or a shared Pixelblaze)
+
+    Yields:
+        Pixelblaze: Connected Pixelblaze instance
+    """
+    if ctx.obj.get('pixelblaze') is not None:
+        yield ctx.obj['pixelblaze']
+        return
+    with get_pixelblaze(ctx) as pb:
+        yield pb
 
 
 def cli(cli_group, **click_kwargs) -> Callable:
@@ -317,7 +676,10 @@ def cli(cli_group, **click_kwargs) -> Callable:
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         def wrapper(ctx: click.Context, *args, **kwargs):
-            with get_pixelblaze(ctx) as pb:
+            ips = expand_ips(ctx.obj['ip']) if ctx.obj.get('pixelblaze') is None else []
+            if ips:
+                return run_on_each(ips, func, *args, **kwargs)
+            with connect(ctx) as pb:
                 return func(pb, *args, **kwargs)
 
         # Apply click.pass_context and cli.command() decorators
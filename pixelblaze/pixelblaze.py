@@ -229,6 +229,10 @@ class Pixelblaze:
     cacheRefreshInterval = 1000  # milliseconds used internally
     patternCache = None
 
+    # Compiler cache: the compiler source last loaded, and the MiniRacer context it's loaded into
+    compilerSource = None
+    compilerContext = None
+
     # Parser state cache
     latestStats = None
     latestSequencer = None
@@ -319,6 +323,7 @@ class Pixelblaze:
             """
             try:
                 self.enumeratorType = enumeratorType
+                self.seenPixelblazes = []  # per enumerator, or a second enumeration would skip devices already seen
                 self.timeout = timeout
                 self.proxyUrl = proxyUrl
                 self.listenSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -332,8 +337,15 @@ class Pixelblaze:
             """
             Stop listening for datagrams, terminate listener thread and close socket.
             """
+            self.close()
+
+        def close(self):
+            """
+            Stop listening for beacons and close the socket, without waiting for the enumerator to be garbage collected.
+            """
             if self.listenSocket is not None:
                 self.listenSocket.close()
+                self.listenSocket = None
 
         def __iter__(self):
             # Return __iter__ object.
@@ -343,12 +355,19 @@ class Pixelblaze:
             """
             Return the next Pixelblaze found, until the timeout expires.
             """
+            if self.listenSocket is None:
+                raise StopIteration
             # If we receive a beacon packet from a new Pixelblaze, return an object for it.
             self.timeStop = self._time_in_millis() + self.timeout
             while self._time_in_millis() <= self.timeStop:
                 try:
+                    # Only wait out what's left of the timeout, so repeat beacons and other traffic can't extend it.
+                    self.listenSocket.settimeout(max(self.timeStop - self._time_in_millis(), 1) / 1000.0)
                     data, ipAddress = self.listenSocket.recvfrom(1024)
-                    pkt = struct.unpack("<LLL", data)
+                    if len(data) < 12:
+                        continue
+                    # Time sync packets share this port and are longer than a beacon, so only unpack the header.
+                    pkt = struct.unpack_from("<LLL", data)
                     if pkt[0] == 42:  # beacon packet
                         if ipAddress not in self.seenPixelblazes:
                             # Add this address to our list so we don't repeat it.
@@ -470,27 +489,35 @@ class Pixelblaze:
         specialConfig = -1
         specialStats = -2
 
-    class frameTypes(Flag):
+    class frameTypes(IntFlag):
         """Continuation flags for messages sent and received by a Pixelblaze.  The second byte of a binary frame tells whether this packet is part of a set."""
         frameNone = 0
         frameFirst = 1
         frameMiddle = 2
         frameLast = 4
 
-    def wsReceive(self, *, binaryMessageType: messageTypes = None) -> Union[str, bytes, None]:
+    def wsReceive(self, *, binaryMessageType: messageTypes = None, acceptText: bool = False) -> Union[str, bytes, None]:
         """Wait for a message of a particular type from the Pixelblaze.
 
         Args:
             binaryMessageType (messageTypes, optional): The type of binary message to wait for (if None, waits for a text message). Defaults to None.
+            acceptText (bool, optional): If True, also return any non-chatty text message that arrives while waiting for the binary message. Defaults to False.
 
         Returns:
             Union[str, bytes, None]: The message received from the Pixelblaze (of type bytes for binaryMessageTypes, otherwise of type str), or None if a timeout occurred.
         """
         message = None
-        startTime = self._time_in_millis()
+        # One deadline for the whole wait, so a steady stream of chatty frames (stats, sequencer updates) can't keep
+        # us here indefinitely; the socket's own timeout is only a backstop for a frame that arrives half-sent.
+        deadline = self._time_in_millis() + 1000 * (self.ws.gettimeout() or self.default_recv_timeout)
         # loop until we have all the packets we want or we hit timeout.
         while True:
             try:
+                if self.ws.sock is None:  # the socket was dropped under us; take the reconnect path below
+                    raise websocket._exceptions.WebSocketConnectionClosedException("socket is already closed.")
+                remaining = deadline - self._time_in_millis()
+                if remaining <= 0 or not select.select([self.ws.sock], [], [], remaining / 1000)[0]:
+                    return None
                 frame = self.ws.recv()
                 if type(frame) is str:
                     # Some frames are sent unrequested and often interrupt the conversation; we'll just
@@ -502,11 +529,11 @@ class Pixelblaze:
                         self.latestSequencer = frame
                         if binaryMessageType is self.messageTypes.specialConfig: return frame
                     # We wanted a text frame, we got a text frame.
-                    elif binaryMessageType is None:
+                    elif binaryMessageType is None or (acceptText and message is None):
                         return frame
                 else:
                     frameType = frame[0]
-                    if frameType == self.messageTypes.previewFrame.value:
+                    if frameType == self.messageTypes.previewFrame:
                         # This packet type doesn't have frameType flags.
                         if binaryMessageType == self.messageTypes.previewFrame:
                             return frame[19:]
@@ -516,16 +543,16 @@ class Pixelblaze:
                     # Check the flags to see if we need to read more packets.
                     frameFlags = frame[1]
                     if message is None and not (
-                            frameFlags & self.frameTypes.frameFirst.value): raise  # The first frame must be a start frame
+                            frameFlags & self.frameTypes.frameFirst): raise  # The first frame must be a start frame
                     if message is not None and (
-                            frameFlags & self.frameTypes.frameFirst.value): raise  # We shouldn't get a start frame after we've started
+                            frameFlags & self.frameTypes.frameFirst): raise  # We shouldn't get a start frame after we've started
                     if message is None:
                         message = frame[2:]  # Start with the first packet...
                     else:
                         message += frame[2:]  # ...and append the rest until we reach the end.
 
                     # If we've received all the packets, deal with the message.
-                    if frameFlags & self.frameTypes.frameLast.value:
+                    if frameFlags & self.frameTypes.frameLast:
                         # Expander config frames are ONLY sent during a config request, but they sometimes arrive
                         # out of order so we'll save them and retrieve them separately.
                         if frameType == self.messageTypes.ExpanderConfig:
@@ -538,10 +565,8 @@ class Pixelblaze:
                             continue  # skip this unwanted binary frame (which shouldn't really happen anyway)
                         return message
 
-            except websocket._exceptions.WebSocketTimeoutException:  # timeout -- we can just ignore this
-                endTime = self._time_in_millis()
-                if (endTime - startTime) > (1000 * self.default_recv_timeout):
-                    return None
+            except websocket._exceptions.WebSocketTimeoutException:  # timeout -- the deadline check will catch it
+                pass
 
             except websocket._exceptions.WebSocketConnectionClosedException:  # try reopening
                 # print("wsReceive reconnection")
@@ -570,6 +595,33 @@ class Pixelblaze:
         """
         return self.wsSendJson({"ping": True}, expectedResponse="ack")
 
+    def sendPings(self, count: int) -> list:
+        """Send several Ping messages back-to-back, then collect their Acknowledgements.
+
+        Pipelining the pings measures the link without waiting a full round-trip between each one. Acknowledgements
+        don't carry an id, but the Pixelblaze answers in order, so each one is matched to the oldest outstanding ping.
+
+        Args:
+            count (int): The number of pings to send.
+
+        Returns:
+            list: The round-trip time of each ping in seconds, or None for each ping that timed out.
+        """
+        self._open()  # make sure it's open, even if it closed while we were doing other things.
+        self._connection_maint()
+        sentTimes = []
+        for _ in range(count):
+            self.ws.send(json.dumps({"ping": True}, indent=None, separators=(',', ':')).encode("utf-8"))
+            sentTimes.append(time.perf_counter())
+
+        roundTrips = []
+        while len(roundTrips) < count:
+            response = self.wsReceive(binaryMessageType=None)
+            if response is None: break
+            if response.startswith('{"ack":'):
+                roundTrips.append(time.perf_counter() - sentTimes[len(roundTrips)])
+        return roundTrips + [None] * (count - len(roundTrips))
+
     def _connection_maint(self):
         """
         Flush receive buffer and see that connection handshake is maintained.
@@ -580,6 +632,8 @@ class Pixelblaze:
         is handled by ws.recv(), keeps the connection alive.  Otherwise it'll time out and hang or
         disconnect after about 10 minutes.
         """
+        if self.ws.sock is None:  # nothing to select() on; let the caller's reconnect handling take over
+            raise websocket._exceptions.WebSocketConnectionClosedException("socket is already closed.")
         while True:
             ready = select.select([self.ws.sock], [], [], 0)
             if not ready[0]:
@@ -1157,21 +1211,32 @@ class Pixelblaze:
         """
         if forceRefresh is True or ((self._time_in_millis() - self.cacheRefreshTime) > self.cacheRefreshInterval):
             # Update the patternList cache.
-            newPatternCache = dict()
             oldTimeout = self.ws.gettimeout()
             self.ws.settimeout(3 * self.default_recv_timeout)
             response = self.wsSendJson({"listPrograms": True}, expectedResponse=self.messageTypes.getProgramList)
             self.ws.settimeout(oldTimeout)
             if response is not None:
-                for pattern in [m.split("\t") for m in response.decode("utf-8").split("\n")]:
-                    if len(pattern) == 2:
-                        newPatternCache[pattern[0]] = pattern[1]
-                self.patternCache = newPatternCache
+                self.patternCache = self.__decodePatternList(response)
             self.cacheRefreshTime = self._time_in_millis()
 
         # Return the cached list.
         return self.patternCache
 
+    def __decodePatternList(self, data: bytes) -> dict:
+        """An internal function to convert the pattern list from its native "id<tab>name<newline>" format into a dictionary.
+
+        Args:
+            data (bytes): The binary getProgramList message received from the Pixelblaze.
+
+        Returns:
+            dict: A dictionary of the patterns, where the patternId is the key and the patternName is the value.
+        """
+        patterns = dict()
+        for pattern in [m.split("\t") for m in data.decode("utf-8").split("\n")]:
+            if len(pattern) == 2:
+                patterns[pattern[0]] = pattern[1]
+        return patterns
+
     def setActivePattern(self, patternId: str, *, saveToFlash: bool = False):
         """Sets the active pattern.
 
@@ -1210,6 +1275,7 @@ class Pixelblaze:
             patternId (str): The patternId of the desired pattern.
         """
         self.wsSendJson({"deleteProgram": patternId}, expectedResponse=None)
+        self.cacheRefreshTime = 0  # the pattern list has changed, so refresh it on next use
 
     def getPreviewImage(self, patternId: str) -> bytes:
         """Gets the preview image (a JPEG with 150 iterations of the pattern) saved within a pattern.
@@ -1249,6 +1315,18 @@ class Pixelblaze:
         """
         self.wsSendJson({"setControls": dictControls, "save": saveToFlash}, expectedResponse="ack")
 
+    def setActiveControlsAndVariables(self, dictValues: dict, *, saveToFlash: bool = False):
+        """Sets both the UI controls and the variables of the active pattern from one dictionary, in a single message.
+
+        Equivalent to calling `setActiveControls()` and then `setActiveVariables()` with the same values, but with only
+        one round-trip to the Pixelblaze.
+
+        Args:
+            dictValues (dict): A dictionary containing the values to be set, with the control or variable name as the key.
+            saveToFlash (bool, optional): If True, the control settings are stored in Flash memory; otherwise they revert on a reboot. Defaults to False.
+        """
+        self.wsSendJson({"setControls": dictValues, "save": saveToFlash, "setVars": dictValues}, expectedResponse="ack")
+
     # --- PATTERNS tab: SAVED PATTERNS section: convenience functions
     """The Pixelblaze API has functions to 'set' individual property values, 
     but can only 'get' property values as part of a JSON dictionary containing all the settings
@@ -1344,7 +1422,10 @@ class Pixelblaze:
             """Cache compiler code for future use."""
             try:
                 cache_file = _get_compiler_cache_dir() / f"{version}.js"
-                cache_file.write_text(compiler_code)
+                # Write via a temp file so an interrupted write can't leave a truncated compiler behind.
+                temp_file = cache_file.with_suffix('.tmp')
+                temp_file.write_text(compiler_code)
+                temp_file.replace(cache_file)
             except Exception:
                 pass
 
@@ -1472,9 +1553,12 @@ class Pixelblaze:
             if allow_cache:
                 _cache_compiler(version, compiler)
 
-        # Load the compiler into the interpreter.
-        ctx = MiniRacer()
-        ctx.eval(compiler)
+        # Load the compiler into the interpreter, unless an earlier compile already loaded this one.
+        if compiler != self.compilerSource:
+            self.compilerContext = MiniRacer()
+            self.compilerContext.eval(compiler)
+            self.compilerSource = compiler
+        ctx = self.compilerContext
 
         # Use the interpreter to run the compiler to convert the sourcecode into the bytecode.
         # set up MiniRacer to give detailed error messages
@@ -1518,17 +1602,19 @@ class Pixelblaze:
     
     @staticmethod
     def isPatternId(id: str):
-        return len(id) == 17 and all(c in Pixelblaze._pattern_id_chars for c in id)
+        # strip() removes every valid character in one C-level pass, so a valid id leaves nothing behind
+        return len(id) == 17 and not id.strip(Pixelblaze._pattern_id_chars)
 
     def calculate_crc32(self, data):
         return binascii.crc32(data) & 0xffffffff
 
-    def sendPatternToRenderer(self, bytecode: bytes, controls: dict = {}):
+    def sendPatternToRenderer(self, bytecode: bytes, controls: dict = {}, variables: dict = None):
         """Sends a blob of bytecode and a JSON dictionary of UI controls to the Renderer. Mimics the actions of the webUI code editor.
 
         Args:
             bytecode (bytes): A valid blob of bytecode as generated by the Editor tab in the Pixelblaze webUI.
             controls (dict, optional): a dictionary of UI controls exported by the pattern, with controlName as the key and controlValue as the value. Defaults to {}.
+            variables (dict, optional): a dictionary of exported variables to set, with variableName as the key and variableValue as the value; sent along with the controls rather than with a separate `setActiveVariables()` call. Defaults to None.
         """
         # NOTE: crc may only be needed for v3.5+ firmware, but doesn't seem to hurt other versions
         crcVal = self.calculate_crc32(bytecode)
@@ -1537,7 +1623,10 @@ class Pixelblaze:
             expectedResponse="ack")
         self.wsSendBinary(self.messageTypes.putByteCode, bytecode, expectedResponse="ack")
         time.sleep(0.25)
-        self.wsSendJson({"setControls": controls})
+        if variables:
+            self.wsSendJson({"setControls": controls, "setVars": variables})
+        else:
+            self.wsSendJson({"setControls": controls})
         self.wsSendJson({"pause": False}, expectedResponse="ack")
         time.sleep(0.25)
 
@@ -1575,8 +1664,7 @@ class Pixelblaze:
             sourceCode=json.dumps(payload, indent=None, separators=(',', ':'))
         )
         pbp.toPixelblaze(self)
-
-        
+        self.cacheRefreshTime = 0  # the pattern list has changed, so refresh it on next use
 
     # --- MAPPER tab: Pixelmap settings
 
@@ -1807,6 +1895,48 @@ class Pixelblaze:
             if self.latestSequencer is None: ignored = self.getConfigSettings()
             return json.loads(self.latestSequencer)
 
+    def getConfigAll(self, playlistId: str = "_defaultplaylist_") -> dict:
+        """Retrieves the settings, pattern list, playlist and Sequencer state in a single round-trip, as the web UI does when it loads.
+
+        Args:
+            playlistId (str, optional): The name of the playlist to fetch. Defaults to "_defaultplaylist_".
+
+        Returns:
+            dict: A dictionary with the keys 'config', 'patterns', 'playlist' and 'sequencer', holding the results of
+                getConfigSettings(), getPatternList(), getSequencerPlaylist() and getConfigSequencer() respectively.
+        """
+        self.latestSequencer = None  # clear cache to force refresh
+        self.latestExpander = None  # clear cache to force refresh
+
+        # The Pixelblaze answers each key of a combined request in turn, so ask for everything at once and then
+        # sort the replies as they arrive. The OutputExpander config (if any) is stashed by wsReceive along the way.
+        config = patterns = playlist = None
+        oldTimeout = self.ws.gettimeout()
+        self.ws.settimeout(3 * self.default_recv_timeout)
+        self.wsSendJson({"getConfig": True, "listPrograms": True, "getPlaylist": playlistId}, expectedResponse=None)
+        while config is None or patterns is None or playlist is None or self.latestSequencer is None:
+            response = self.wsReceive(binaryMessageType=self.messageTypes.getProgramList, acceptText=True)
+            if response is None: break
+            if type(response) is bytes:
+                patterns = self.__decodePatternList(response)
+            elif response.startswith('{"playlist":'):
+                playlist = json.loads(response)
+            elif config is None and not response.startswith('{"ack":'):
+                config = json.loads(response)
+        self.ws.settimeout(oldTimeout)
+
+        if patterns is not None:
+            self.patternCache = patterns
+            self.cacheRefreshTime = self._time_in_millis()
+
+        # If anything went missing, fall back to fetching it on its own.
+        return {
+            'config': config if config is not None else self.getConfigSettings(),
+            'patterns': patterns if patterns is not None else self.getPatternList(forceRefresh=True),
+            'playlist': playlist if playlist is not None else self.getSequencerPlaylist(playlistId),
+            'sequencer': self.getConfigSequencer() if self.latestSequencer is None else json.loads(self.latestSequencer)
+        }
+
     def getConfigExpander(self) -> dict:
         """Retrieves the OutputExpander configuration.
 
@@ -2895,6 +3025,7 @@ class PBP:
     # Members:
     __id = None
     __binaryData = None
+    __offsets = None
 
     # The first 9 DWORDs of the binaryData is a header containing offsets to the components:
     #   0=version,
@@ -2902,6 +3033,7 @@ class PBP:
     #   3=jpegOffset, 4=jpegLength,
     #   5=bytecodeOffset, 6=bytecodeLength,
     #   7=sourceOffset, 8=sourceLength
+    __header = struct.Struct('<9I')
 
     # private constructor
     def __init__(self, id: str, blob: bytes):
@@ -3013,7 +3145,7 @@ class PBP:
         # Build header (9 DWORDs = 36 bytes, little-endian)
         # Format: version, nameOffset, nameLength, jpegOffset, jpegLength,
         #         bytecodeOffset, bytecodeLength, sourceOffset, sourceLength
-        header = struct.pack('<9I',
+        header = PBP.__header.pack(
             1,  # version
             name_offset, name_length,
             jpeg_offset, jpeg_length,
@@ -3026,6 +3158,14 @@ class PBP:
 
         return PBP.fromBytes(patternId, blob)
 
+    def __component(self, index: int) -> bytes:
+        """Returns the component whose offset is at header DWORD `index` (its length follows at `index + 1`)."""
+        # The header is unpacked once, straight from the blob, rather than once per property.
+        if self.__offsets is None:
+            self.__offsets = PBP.__header.unpack_from(self.__binaryData)
+        offset = self.__offsets[index]
+        return self.__binaryData[offset:offset + self.__offsets[index + 1]]
+
     # Class properties:
     @property
     def id(self) -> str:
@@ -3043,9 +3183,7 @@ class PBP:
         Returns:
             str: The (human-readable) name of the pattern contained in this Pixelblaze Binary Pattern (PBP).
         """
-        # Calculate the offset for this component.
-        offsets = struct.unpack('<9I', self.__binaryData[:36])
-        return self.__binaryData[offsets[1]:offsets[1] + offsets[2]].decode('UTF-8')
+        return self.__component(1).decode('UTF-8')
 
     @property
     def jpeg(self) -> bytes:
@@ -3054,9 +3192,7 @@ class PBP:
         Returns:
             bytes: The preview JPEG of the pattern contained in this Pixelblaze Binary Pattern (PBP).
         """
-        # Calculate the offset for this component.
-        offsets = struct.unpack('<9I', self.__binaryData[:36])
-        return self.__binaryData[offsets[3]:offsets[3] + offsets[4]]
+        return self.__component(3)
 
     @property
     def byteCode(self) -> bytes:
@@ -3065,9 +3201,7 @@ class PBP:
         Returns:
             bytes: The bytecode of the pattern contained in this Pixelblaze Binary Pattern (PBP).
         """
-        # Calculate the offset for this component.
-        offsets = struct.unpack('<9I', self.__binaryData[:36])
-        return self.__binaryData[offsets[5]:offsets[5] + offsets[6]]
+        return self.__component(5)
 
     @property
     def sourceCode(self) -> str:
@@ -3076,9 +3210,7 @@ class PBP:
         Returns:
             str: The source code of the pattern as a JSON-encoded string.
         """
-        # Calculate the offset for this component.
-        offsets = struct.unpack('<9I', self.__binaryData[:36])
-        return _LZstring.decompress(self.__binaryData[offsets[7]:offsets[7] + offsets[8]])
+        return _LZstring.decompress(self.__component(7))
 
     # Class methods:
     def toFile(self, fileName: str = None):
@@ -1,19 +1,34 @@
 #!/usr/bin/env python3
 """Lightweight CLI tests for pixelblaze-client."""
 
-import json
+import io
+import sys
+import time
 import shlex
+import pytest
 from click.testing import CliRunner
 from pixelblaze.cli import pixelblaze
+from pixelblaze.cli_utils import discover_pixelblaze, json_loads
 
+_runner = CliRunner()
 
-def test_cli():
+
+@pytest.fixture(scope='module')
+def pb():
+    """One Pixelblaze connection for the whole run, shared with each command the way `pb shell` does it."""
+    from pixelblaze.pixelblaze import Pixelblaze
+
+    with Pixelblaze(discover_pixelblaze('auto')) as connection:
+        yield connection
+
+
+def test_cli(pb):
     """Run basic CLI tests."""
     print("Starting CLI tests...")
 
     # Get original state
     print("\n1. Getting original state...")
-    result = cli(f'''
+    result = cli(pb, f'''
     
         % pb cfg
     
@@ -32,7 +47,7 @@ def test_cli():
     # Change pixels
     test_pixels = original_pixels + 10
     print(f"\n2. Setting pixels to {test_pixels} (+10 from original)...")
-    cli(f'''
+    cli(pb, f'''
     
         % pb pixels {test_pixels}
     
@@ -40,7 +55,7 @@ def test_cli():
 
     # Verify pixels changed
     print("   Verifying pixels changed...")
-    result = cli(f'''
+    result = cli(pb, f'''
     
         % pb pixels
     
@@ -51,7 +66,7 @@ def test_cli():
 
     # Change brightness
     print("\n3. Setting brightness to 0.2...")
-    cli(f'''
+    cli(pb, f'''
     
         % pb on 0.2
         
@@ -60,7 +75,7 @@ def test_cli():
 
     # Verify pattern doesn't exist
     print("\n4. Verifying '__pb_cli_test__' doesn't exist...")
-    result = cli('''
+    result = cli(pb, '''
     
         % pb cfg
         
@@ -77,7 +92,7 @@ def test_cli():
 
     # Save test pattern
     print("\n5. Saving '__pb_cli_test__' pattern (single color)...")
-    cli(f'''
+    cli(pb, f'''
 
         % pb pattern "rgb(.1, 0, .1)" --write __pb_cli_test__
     
@@ -86,7 +101,7 @@ def test_cli():
 
     # Verify pattern exists
     print("\n6. Verifying pattern was created...")
-    result = cli(f''' % pb cfg ''')
+    result = cli(pb, f''' % pb cfg ''')
     cfg = get_json_output(result)
     patterns = cfg['patterns']
     test_pattern_id = None
@@ -99,7 +114,7 @@ def test_cli():
 
     # Switch to test pattern
     print("\n7. Switching to test pattern...")
-    cli(f'''
+    cli(pb, f'''
     
         % pb pattern __pb_cli_test__
     
@@ -108,7 +123,7 @@ def test_cli():
 
     # Verify we're on the test pattern
     print("\n8. Verifying test pattern is active...")
-    result = cli(f''' % pb cfg ''')
+    result = cli(pb, f''' % pb cfg ''')
     cfg = get_json_output(result)
     active_pattern_id = cfg.get('sequencer', {}).get('activeProgram', {}).get('activeProgramId')
     assert active_pattern_id == test_pattern_id, f"Expected active pattern {test_pattern_id}, got {active_pattern_id}"
@@ -116,7 +131,7 @@ def test_cli():
 
     # Delete test pattern
     print("\n9. Deleting '__pb_cli_test__' pattern...")
-    cli(f'''
+    cli(pb, f'''
     
         % pb pattern __pb_cli_test__ --rm
     
@@ -125,7 +140,7 @@ def test_cli():
 
     # Verify pattern doesn't exist anymore
     print("\n10. Verifying pattern was deleted...")
-    result = cli(f'''
+    result = cli(pb, f'''
     
         % pb cfg
     
@@ -138,22 +153,22 @@ def test_cli():
 
     # Restore original pixels
     print(f"\n11. Restoring original pixels ({original_pixels})...")
-    cli(f''' % pb pixels {original_pixels} ''')
-    result = cli(''' % pb pixels ''')
+    cli(pb, f''' % pb pixels {original_pixels} ''')
+    result = cli(pb, ''' % pb pixels ''')
     restored_pixels = int(result.output.strip().split('\n')[-1])
     assert restored_pixels == original_pixels, f"Failed to restore pixels"
     print(f"   ✓ Pixels restored to {original_pixels}")
 
     # Restore original brightness
     print(f"\n12. Restoring original brightness ({original_brightness})...")
-    cli(f''' % pb on {original_brightness} ''')
+    cli(pb, f''' % pb on {original_brightness} ''')
     print(f"   ✓ Brightness restored to {original_brightness}")
 
     # Restore original pattern
     if original_pattern_id:
         print(f"\n13. Restoring original pattern ({original_pattern_name})...")
-        cli(f'% pb pattern {original_pattern_id}')
-        result = cli('% pb cfg')
+        cli(pb, f'% pb pattern {original_pattern_id}')
+        result = cli(pb, '% pb cfg')
         cfg = get_json_output(result)
         active_pattern_id = cfg.get('sequencer', {}).get('activeProgram', {}).get('activeProgramId')
         assert active_pattern_id == original_pattern_id, f"Failed to restore pattern"
@@ -163,10 +178,10 @@ def test_cli():
 
     print("\n✅ All tests passed!")
 
-def run_cmd(*args):
-    """Run a CLI command and return the result."""
-    runner = CliRunner()
-    result = runner.invoke(pixelblaze, args)
+
+def run_cmd(pb, *args):
+    """Run a CLI command on the shared connection and return the result."""
+    result = _runner.invoke(pixelblaze, args, obj={'pixelblaze': pb})
     if result.exit_code != 0:
         print(f"Command failed: pb {' '.join(args)}")
         print(f"Output: {result.output}")
@@ -174,7 +189,7 @@ def run_cmd(*args):
     return result
 
 
-def cli(command_str):
+def cli(pb, command_str):
     """Run a CLI command from a demo-style string (e.g., '% pb pattern foo').
 
     Parses commands in the format:
@@ -195,19 +210,232 @@ def cli(command_str):
     args = shlex.split(command_str)
 
     # Run the command
-    return run_cmd(*args)
+    return run_cmd(pb, *args)
 
 
 def get_json_output(result):
     """Extract JSON from result output (ignoring log lines on stderr)."""
-    # Output goes to stdout, logs go to stderr - get last line that's JSON
-    lines = result.output.strip().split('\n')
+    # Output goes to stdout, logs go to stderr - get last line that's JSON. Click 8.2+ keeps stderr out of
+    # result.stdout; older versions mix it in unless told not to, hence still scanning for the JSON line.
+    lines = result.stdout.strip().split('\n')
     for line in reversed(lines):
         line = line.strip()
-        if line.startswith('{') or line.startswith('['):
-            return json.loads(line)
+        if line[:1] in ('{', '['):
+            return json_loads(line)
     raise ValueError("No JSON found in output")
 
 
+class FakePixelblaze:
+    """Stands in for a connected Pixelblaze, for tests of the CLI's own plumbing."""
+
+    def __init__(self, ipAddress='127.0.0.1', pixelCount=100, patterns=None, delay=0):
+        self.ipAddress = ipAddress
+        self.pixelCount = pixelCount
+        self.delay = delay
+        self.patterns = patterns or {}
+        self.pattern_list_fetches = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def getPixelCount(self):
+        time.sleep(self.delay)
+        return self.pixelCount
+
+    def getMapCoordinates(self):
+        return [[0, 0.5, 1], [0, 0, 0]]
+
+    def getMapFunction(self):
+        return "function (pixelCount) { return [] }"
+
+    def getPatternList(self, forceRefresh=False):
+        self.pattern_list_fetches += 1
+        return dict(self.patterns)
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """Point the CLI's cache directory at an empty temporary one."""
+    from pixelblaze.cli_utils import get_cache_dir
+
+    monkeypatch.setenv('HOME', str(tmp_path))
+    get_cache_dir.cache_clear()
+    yield get_cache_dir()
+    get_cache_dir.cache_clear()
+
+
+def test_daemon_map_ignores_stdin(monkeypatch):
+    """`pb map` run by the daemon shows the map, rather than setting one from the daemon's empty stdin."""
+    from pixelblaze.cli_daemon import _run_command
+
+    monkeypatch.setattr(sys, 'stdin', io.TextIOWrapper(io.BytesIO(b'')))  # Like the daemon's /dev/null
+    reply = _run_command(FakePixelblaze(), ['map'])
+    assert reply['exit_code'] == 0, reply['stderr']
+    assert json_loads(reply['stdout'])['coordinates'] == FakePixelblaze().getMapCoordinates()
+
+
+def daemon_reply(request: bytes):
+    """Send one raw request line to the daemon's request handler and return its reply."""
+    import socket
+    from pixelblaze.cli_daemon import _handle_request
+
+    client, server = socket.socketpair()
+    with client, server, server.makefile('rwb') as stream:
+        client.sendall(request + b'\n')
+        assert not _handle_request(FakePixelblaze(), stream)
+        stream.flush()
+        return json_loads(client.makefile('rb').readline())
+
+
+def test_daemon_survives_bad_requests(tmp_path, monkeypatch):
+    """Malformed requests get an error reply instead of stopping the daemon."""
+    monkeypatch.chdir(tmp_path)
+    assert 'error' in daemon_reply(b'[]')
+    assert 'error' in daemon_reply(b'{"args": "pixels"}')
+    assert 'error' in daemon_reply(b'{"args": ["pixels"], "cwd": "%s"}' % str(tmp_path / 'gone').encode())
+    assert daemon_reply(b'{"args": ["pixels"], "cwd": "%s"}' % str(tmp_path).encode())['stdout'] == "100\n"
+
+
+def test_daemon_forwards_only_what_it_can_run(monkeypatch):
+    """Invocations asking for a different connection than the daemon's run in-process instead."""
+    from pixelblaze.cli_daemon import _forwardable_ip
+
+    monkeypatch.delenv('PB_IP', raising=False)
+    assert _forwardable_ip(['pixels']) == 'auto'
+    assert _forwardable_ip(['--ip', '10.0.0.2', 'on', '0.5']) == '10.0.0.2'
+    assert _forwardable_ip(['--ip=10.0.0.2', 'pixels']) == '10.0.0.2'
+    assert _forwardable_ip(['pbb', '--ip', '10.0.0.9', 'backup']) is None
+    assert _forwardable_ip(['pbb', '--ip=10.0.0.9']) is None
+    assert _forwardable_ip(['--timeout', '10', 'pixels']) is None
+    assert _forwardable_ip(['--no-cache', 'pixels']) is None
+    assert _forwardable_ip(['cache', 'show']) is None
+
+
+def test_shell_script_isnt_command_input():
+    """A piped `pb shell` script runs line by line; a command with no input doesn't swallow the rest of it."""
+    result = _runner.invoke(pixelblaze, ['shell'], input='map\npixels\n', obj={'pixelblaze': FakePixelblaze()})
+    assert result.exit_code == 0, result.output
+    map_json, pixel_count = result.stdout.strip().split('\n')
+    assert json_loads(map_json)['fn'] == FakePixelblaze().getMapFunction()
+    assert pixel_count == '100'
+
+
+def test_corrupt_pattern_cache_is_refetched(cache_dir):
+    """A pattern cache that isn't a pattern list is dropped and replaced with a fresh one."""
+    from pixelblaze.cli_utils import get_pattern_list, read_pattern_cache, get_pattern_cache_files
+
+    pb = FakePixelblaze(patterns={'AAAAAAAAAAAAAAAAA': 'Rainbow'})
+    cache_file = cache_dir / f'patterns-{pb.ipAddress}.json'
+    for corrupt in ('[1, 2]', '"patterns"', '{"fetched": "yesterday", "patterns": {}}', '{not json'):
+        cache_file.write_text(corrupt)
+        assert get_pattern_list(pb) == (pb.patterns, False)
+        assert read_pattern_cache(cache_file)['patterns'] == pb.patterns
+    assert get_pattern_cache_files() == [cache_file]
+
+
+def test_pattern_missing_from_cache_refreshes_list(cache_dir):
+    """A pattern added since the list was cached is still found, by refetching the list once."""
+    from pixelblaze.cli import _find_pattern
+    from pixelblaze.cli_utils import get_pattern_list
+
+    pb = FakePixelblaze(patterns={'AAAAAAAAAAAAAAAAA': 'Rainbow'})
+    get_pattern_list(pb)
+    pb.patterns['BBBBBBBBBBBBBBBBB'] = 'Fire Sparks'
+    assert _find_pattern(pb, 'rainbow') == ('AAAAAAAAAAAAAAAAA', 'Rainbow')
+    assert pb.pattern_list_fetches == 1
+    assert _find_pattern(pb, 'fire') == ('BBBBBBBBBBBBBBBBB', 'Fire Sparks')
+    assert pb.pattern_list_fetches == 2
+    assert _find_pattern(pb, 'fire') == ('BBBBBBBBBBBBBBBBB', 'Fire Sparks')
+    assert pb.pattern_list_fetches == 2
+
+
+def test_cache_show_and_clear_pattern_lists(cache_dir):
+    """`pb cache show` lists the cached pattern lists and `pb cache clear --patterns` removes them."""
+    from pixelblaze.cli_utils import get_pattern_list, get_pattern_cache_files
+
+    get_pattern_list(FakePixelblaze(patterns={'AAAAAAAAAAAAAAAAA': 'Rainbow'}))
+    (cache_dir / 'patterns-10.0.0.9.json').write_text('{corrupt')
+    result = _runner.invoke(pixelblaze, ['cache', 'show'], obj={})
+    assert '127.0.0.1: 1 patterns' in result.output
+    assert '10.0.0.9 (unreadable' in result.output
+    result = _runner.invoke(pixelblaze, ['cache', 'clear', '--patterns'], obj={})
+    assert result.exit_code == 0, result.output
+    assert get_pattern_cache_files() == []
+
+
+def test_ip_cache_ignores_bad_entries(cache_dir):
+    """An IP cache that isn't a JSON object is treated as empty rather than breaking discovery."""
+    from pixelblaze.cli_utils import get_cached_ip, cache_ip
+
+    for bad in ('["10.0.0.2"]', '"10.0.0.2"', '{not json'):
+        (cache_dir / 'last_ip.json').write_text(bad)
+        assert get_cached_ip() is None
+    cache_ip('10.0.0.2')
+    assert get_cached_ip() == '10.0.0.2'
+
+
+def test_legacy_ip_cache_is_migrated(cache_dir):
+    """The plain text last_ip.txt from older versions is moved into last_ip.json once."""
+    from pixelblaze.cli_utils import get_cached_ip
+
+    (cache_dir / 'last_ip.txt').write_text('10.0.0.3\n')
+    assert get_cached_ip() == '10.0.0.3'
+    assert not (cache_dir / 'last_ip.txt').exists()
+    assert json_loads((cache_dir / 'last_ip.json').read_bytes())['ip'] == '10.0.0.3'
+    assert get_cached_ip() == '10.0.0.3'
+
+
+def test_legacy_ip_cache_removed_when_json_exists(cache_dir):
+    """A stale last_ip.txt next to last_ip.json is deleted rather than left behind forever."""
+    from pixelblaze.cli_utils import cache_ip, get_cached_ip
+
+    cache_ip('10.0.0.4')
+    (cache_dir / 'last_ip.txt').write_text('10.0.0.5\n')
+    assert get_cached_ip() == '10.0.0.4'
+    assert not (cache_dir / 'last_ip.txt').exists()
+
+
+@pytest.mark.parametrize('indent', [False, True])
+def test_json_output_same_with_or_without_orjson(monkeypatch, indent):
+    """Non-ASCII pattern names come out the same whether or not the optional orjson is installed."""
+    from pixelblaze import cli_utils
+
+    orjson = pytest.importorskip('orjson')
+    patterns = {'AAAAAAAAAAAAAAAAA': 'Régenbogen ✨', 'BBBBBBBBBBBBBBBBB': '火花'}
+    with_orjson = cli_utils.json_dumps(patterns, indent=indent)
+    monkeypatch.setattr(cli_utils, 'orjson', None)
+    assert cli_utils.json_dumps(patterns, indent=indent) == with_orjson
+    assert 'Régenbogen ✨' in with_orjson
+
+
+def test_several_ips_output_is_labelled_in_order(monkeypatch):
+    """With --ip a,b each line of output says which Pixelblaze it's from, in the order given."""
+    import pixelblaze.pixelblaze as client
+
+    devices = {
+        '10.0.0.1': FakePixelblaze('10.0.0.1', pixelCount=100, delay=0.2),  # Finishes last
+        '10.0.0.2': FakePixelblaze('10.0.0.2', pixelCount=200),
+    }
+    monkeypatch.setattr(client, 'Pixelblaze', devices.get)
+    result = _runner.invoke(pixelblaze, ['--ip', '10.0.0.1,10.0.0.2', 'pixels'], obj={})
+    assert result.exit_code == 0, result.output
+    assert result.stdout == "10.0.0.1\t100\n10.0.0.2\t200\n"
+
+
+@pytest.mark.parametrize('ip', ['10.0.0.1,10.0.0.2', 'all'])
+def test_daemon_start_needs_a_single_ip(cache_dir, ip):
+    """`pb daemon start` refuses several IPs rather than caching and connecting to them as one host."""
+    result = _runner.invoke(pixelblaze, ['--ip', ip, 'daemon', 'start'], obj={})
+    assert result.exit_code != 0
+    assert 'single Pixelblaze' in result.output
+    assert not (cache_dir / 'last_ip.json').exists()
+
+
 if __name__ == '__main__':
-    test_cli()
+    from pixelblaze.pixelblaze import Pixelblaze
+
+    with Pixelblaze(discover_pixelblaze('auto')) as pb:
+        test_cli(pb)
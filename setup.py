@@ -33,6 +33,9 @@ setuptools.setup(
       "click>=8.0",
       "json5",
     ],
+    extras_require={
+      "fast": ["orjson", "pyjson5"],
+    },
     packages=["pixelblaze"],
     python_requires='>=3.9',
     entry_points={